@@ -1,2 +1,2 @@
 # Dit importeert de specifieke VARIABELE 'root_agent' uit de module 'root_agent.py'
-from .root_agent import root_agent
\ No newline at end of file
+from .root_agent import app, root_agent
\ No newline at end of file
@@ -0,0 +1,314 @@
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+
+from cachetools import TTLCache
+
+# Setup Logger
+logger = logging.getLogger(__name__)
+
+# Dutch filler words that don't change what a Kennisbank question is about
+_STOPWORDS = frozenset({
+    "de", "het", "een", "van", "voor", "over", "mijn", "m'n", "ik", "je", "jij", "u",
+    "hoe", "wat", "waar", "welke", "is", "zijn", "in", "op", "met", "aan", "en",
+    "te", "er", "bij", "naar", "kan", "kun", "moet", "graag", "om", "die", "dat",
+})
+_WORD_RE = re.compile(r"\w+")
+
+# Arguments injected by ADK that say nothing about the result
+_IGNORED_PARAMS = frozenset({"tool_context"})
+
+# Guards all response caches; cachetools caches are not thread-safe
+_lock = threading.RLock()
+_MISSING = object()
+
+# Calls that are currently running, so identical concurrent calls can wait for them
+_inflight: Dict[tuple, asyncio.Future] = {}
+
+
+class NotFound(dict):
+    """
+    Marks a tool result as "not found".
+
+    Behaves like the plain error dict it wraps, but cached_tool stores it in
+    the (short-lived) negative cache instead of dropping it like other errors.
+    """
+
+
+class SqliteStore:
+    """
+    Persistent key/value store with a TTL, backed by a SQLite file.
+
+    Used as a second tier behind the in-memory caches, so cached tool results
+    survive a restart of the agent. Keys and values must be JSON serializable.
+    """
+
+    # Expired and surplus entries are swept every this many writes instead of on every write
+    EVICT_EVERY = 200
+
+    def __init__(self, path: str, ttl: float, max_entries: int = 50_000):
+        """
+        Opens (or creates) the store.
+
+        Args:
+            path (str): Path of the SQLite database file.
+            ttl (float): Time in seconds an entry stays valid.
+            max_entries (int): Maximum number of entries; the ones closest to expiring are dropped first.
+                The store may briefly exceed it by up to EVICT_EVERY entries between sweeps.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+        self._evict(time.time())
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+        if self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def get(self, key: tuple, default: Any = None) -> Any:
+        """
+        Returns the stored value for `key`, or `default` if it's missing or expired.
+        """
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (json.dumps(key), time.time())
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Reading from the persistent cache failed: {e}")
+            return default
+        return json.loads(row[0]) if row else default
+
+    def set(self, key: tuple, value: Any):
+        """
+        Stores `value` for `key`, replacing any existing entry.
+        """
+        now = time.time()
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (json.dumps(key), json.dumps(value), now + self.ttl),
+                )
+                self._writes += 1
+                if self._writes % self.EVICT_EVERY == 0:
+                    self._evict(now)
+        except sqlite3.Error as e:
+            logger.warning(f"Writing to the persistent cache failed: {e}")
+
+    def clear(self):
+        """
+        Removes all entries.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalizes a free-text query so paraphrased variants share a cache key.
+
+    Lowercases the text, drops punctuation and Dutch filler words and sorts the
+    remaining words, so "Hoe reset ik mijn wachtwoord?" and "wachtwoord reset"
+    end up with the same key.
+
+    Args:
+        text (str): The query as given by the model.
+
+    Returns:
+        str: The normalized query.
+    """
+    words = {word for word in _WORD_RE.findall(text.lower()) if word not in _STOPWORDS}
+    return " ".join(sorted(words)) or text.strip().lower()
+
+
+def is_error(result: Any) -> bool:
+    """
+    Checks whether a tool result is an error response that shouldn't be cached.
+
+    Args:
+        result: The value returned by a tool function.
+
+    Returns:
+        bool: True if the result (or one of its items) contains an 'error' key.
+    """
+    if isinstance(result, dict):
+        return "error" in result
+    if isinstance(result, list):
+        return any(isinstance(item, dict) and "error" in item for item in result)
+    return False
+
+
+def cached_tool(
+    cache: TTLCache,
+    normalize: Iterable[str] = (),
+    negative_cache: Optional[TTLCache] = None,
+    persistent: Optional[SqliteStore] = None,
+    stale_cache: Optional[TTLCache] = None,
+) -> Callable:
+    """
+    Decorator that caches the results of an async tool keyed on function name and arguments.
+
+    Error responses are never cached, so a failing Topdesk call is retried on
+    the next question. The exception are `NotFound` results, which go into
+    `negative_cache` (when given) so the model retrying the same unknown ID
+    doesn't hit Topdesk again. Identical calls that arrive while the first one is still
+    running wait for its result instead of sending their own request.
+
+    With a `persistent` store, successful results are also written to disk and
+    looked up there when the in-memory cache misses (e.g. after a restart).
+
+    With a `stale_cache`, the last successful result is kept for longer than
+    `cache` keeps it. When a call fails, that older result is returned instead of
+    the error, so a Topdesk outage doesn't break questions that were answered before.
+
+    Args:
+        cache (TTLCache): The cache to store results in. May be shared between tools.
+        normalize (Iterable[str]): Names of free-text arguments that are passed
+            through `normalize_query` before they become part of the key.
+        negative_cache (TTLCache, optional): Cache for `NotFound` results, usually
+            with a shorter TTL than `cache`. Defaults to None (not cached).
+        persistent (SqliteStore, optional): Second-tier store for successful
+            results. Defaults to None (memory only).
+        stale_cache (TTLCache, optional): Long-lived cache of the last successful
+            result, served when a call returns an error. Defaults to None (errors are returned).
+
+    Returns:
+        Callable: The decorator.
+    """
+    normalize = frozenset(normalize)
+
+    def decorator(func: Callable) -> Callable:
+        if not inspect.iscoroutinefunction(func):
+            raise TypeError(f"cached_tool only wraps async tools, got {func.__name__}")
+        signature = inspect.signature(func)
+
+        def make_key(args, kwargs) -> tuple:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return (func.__name__,) + tuple(
+                normalize_query(value) if name in normalize and isinstance(value, str) else value
+                for name, value in bound.arguments.items()
+                if name not in _IGNORED_PARAMS
+            )
+
+        def store(key: tuple, inflight_key: tuple, result: Any) -> bool:
+            # Returns whether the result should also go to the persistent tier; the caller
+            # writes it outside _lock, as a disk write shouldn't block every other cache access
+            with _lock:
+                if isinstance(result, NotFound):
+                    if negative_cache is not None:
+                        negative_cache[key] = result
+                elif not is_error(result):
+                    cache[key] = result
+                    if stale_cache is not None:
+                        stale_cache[key] = result
+                del _inflight[inflight_key]
+            return persistent is not None and not isinstance(result, NotFound) and not is_error(result)
+
+        def fallback(key: tuple, result: Any) -> Any:
+            # Replace an error by the last successful result, if there is one
+            if stale_cache is None or isinstance(result, NotFound) or not is_error(result):
+                return result
+            with _lock:
+                stale = stale_cache.get(key, _MISSING)
+            if stale is _MISSING:
+                return result
+            logger.warning(f"Serving stale result for {key} after an error: {result}")
+            return stale
+
+        def finish(key: tuple, inflight_key: tuple, task: asyncio.Task):
+            if task.cancelled() or task.exception() is not None:
+                with _lock:
+                    del _inflight[inflight_key]
+            elif store(key, inflight_key, task.result()):
+                # Done-callbacks run on the event loop; keep the disk write off it
+                task.get_loop().run_in_executor(None, persistent.set, key, task.result())
+
+        async def lookup(key: tuple):
+            with _lock:
+                result = cache.get(key, _MISSING)
+                if result is _MISSING and negative_cache is not None:
+                    result = negative_cache.get(key, _MISSING)
+            if result is _MISSING and persistent is not None:
+                # Read the disk off the event loop, and keep a hit in memory for the next call
+                result = await asyncio.get_running_loop().run_in_executor(None, persistent.get, key, _MISSING)
+                if result is not _MISSING:
+                    with _lock:
+                        cache[key] = result
+            if result is not _MISSING:
+                logger.debug(f"Cache hit for {key}")
+            return result
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = make_key(args, kwargs)
+            result = await lookup(key)
+            if result is not _MISSING:
+                return result
+
+            # Tasks are bound to their event loop; concurrent Runner.run calls each run
+            # their own loop on another thread, so only coalesce within the same loop
+            inflight_key = (asyncio.get_running_loop(), key)
+            with _lock:
+                task = _inflight.get(inflight_key)
+                is_owner = task is None
+                if is_owner:
+                    task = _inflight[inflight_key] = asyncio.ensure_future(func(*args, **kwargs))
+            if is_owner:
+                task.add_done_callback(functools.partial(finish, key, inflight_key))
+            else:
+                logger.debug(f"Waiting for in-flight call {key}")
+            # Shield the shared task, so one cancelled caller doesn't cancel the others
+            return fallback(key, await asyncio.shield(task))
+
+        return wrapper
+
+    return decorator
+
+
+def clear_caches(*caches: Optional[Union[TTLCache, SqliteStore]]) -> int:
+    """
+    Empties the given caches.
+
+    Args:
+        *caches (TTLCache | SqliteStore | None): The caches to empty. None entries
+            (e.g. a persistent store that isn't configured) are skipped.
+
+    Returns:
+        int: The number of entries removed.
+    """
+    caches = [cache for cache in caches if cache is not None]
+    in_memory = [cache for cache in caches if not isinstance(cache, SqliteStore)]
+    with _lock:
+        removed = sum(len(cache) for cache in in_memory)
+        for cache in in_memory:
+            cache.clear()
+    # A persistent store has its own lock; don't hold _lock during disk I/O
+    for cache in caches:
+        if isinstance(cache, SqliteStore):
+            removed += len(cache)
+            cache.clear()
+    return removed
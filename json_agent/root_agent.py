@@ -1,248 +1,347 @@
+import asyncio
+import functools
+import html
 import json
 import logging
-from typing import Dict, Any, List
+import os
+import re
+import threading
+from importlib.resources import files
+from typing import Dict, Any, List, Optional
 from google.adk.agents import LlmAgent
-from google.adk.tools import FunctionTool
+from google.adk.agents.context_cache_config import ContextCacheConfig
+from google.adk.apps import App
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.tools import FunctionTool, ToolContext
+from google.genai import types
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from .cache import NotFound, SqliteStore, cached_tool, clear_caches
+from .scheduling import PriorityGate
 from .topdesk_service import TopdeskService
 from .zenya_service import ZenyaService
 
 # Setup Logger
 logger = logging.getLogger(__name__)
 
-# Initialize services
-topdesk_service = TopdeskService()
-zenya_service = ZenyaService()
+# Intialize env variables
+load_dotenv()
 
-# Custom functions voor Topdesk API
-def get_knowledge_items(limit: int = 5) -> List[Dict[str, Any]]:
+# Initialize services. Beide services worden pas aangemaakt bij de eerste tool-aanroep
+# (zie _topdesk() en _zenya()); de tokens worden daarna bij het eerste request opgehaald.
+# Zo kan de agent de ene bron bedienen als de andere niet geconfigureerd of bereikbaar is.
+_topdesk_service: Optional[TopdeskService] = None
+_topdesk_lock = threading.Lock()
+_zenya_service: Optional[ZenyaService] = None
+_zenya_lock = threading.Lock()
+
+
+def _topdesk() -> TopdeskService:
+    """Geef de gedeelde TopdeskService en maak hem bij de eerste aanroep aan."""
+    global _topdesk_service
+    if _topdesk_service is None:
+        with _topdesk_lock:
+            if _topdesk_service is None:
+                _topdesk_service = TopdeskService()
+    return _topdesk_service
+
+
+def _zenya() -> ZenyaService:
+    """Geef de gedeelde ZenyaService en maak hem bij de eerste aanroep aan."""
+    global _zenya_service
+    if _zenya_service is None:
+        with _zenya_lock:
+            if _zenya_service is None:
+                _zenya_service = ZenyaService()
+    return _zenya_service
+
+# Maximaal aantal gelijktijdige Topdesk aanroepen over alle sessies heen. Wachtende
+# aanroepen van sessies die al verder in het gesprek zijn gaan voor.
+topdesk_gate = PriorityGate(max_concurrent=8)
+
+# Cache voor Kennisbank antwoorden. Zoektermen worden genormaliseerd, zodat
+# varianten van dezelfde vraag dezelfde cache entry raken.
+kb_cache = TTLCache(maxsize=512, ttl=1800)
+# Optioneel ook op schijf, zodat de Kennisbank cache een herstart overleeft. Tickets
+# worden bewust niet op schijf bewaard (persoonsgegevens, veranderen snel).
+_cache_path = os.environ.get("tool-cache-path")
+kb_store = SqliteStore(_cache_path, ttl=1800) if _cache_path else None
+# Cache voor losse opvragingen via ID of ticketnummer (exacte match)
+id_cache = TTLCache(maxsize=1024, ttl=300)
+# Korte cache voor onbekende ID's, zodat het model bij herhaalde pogingen Topdesk niet blijft bevragen
+not_found_cache = TTLCache(maxsize=1024, ttl=60)
+# Laatst bekende Kennisbank antwoorden, langer bewaard dan de caches hierboven. Als Topdesk
+# een fout geeft, krijgt het model dit oudere antwoord in plaats van de fout.
+stale_cache = TTLCache(maxsize=2048, ttl=24 * 3600)
+
+# Veldenlijsten voor de Topdesk API
+_KB_FIELDS_LIST = "title,description,creationDate,modificationDate"
+_KB_FIELDS_SEARCH = "title,description,keywords,creationDate,modificationDate"
+_KB_FIELDS_FULL = "title,description,content,keywords,creationDate,modificationDate"
+_INCIDENT_FIELDS = "number,briefDescription,processingStatus.name,operator.name,creationDate,targetDate"
+_INCIDENT_DETAIL_FIELDS = (
+    "number,briefDescription,detailedDescription,processingStatus.name,operator.name,"
+    "caller.dynamicName,creationDate,targetDate,action"
+)
+
+# FIQL query onderdelen voor tickets van een aanmelder
+_OPEN_STATUS = "processingStatus.name!=in=(Afgehandeld,Gesloten)"
+_CLOSED_STATUS = "processingStatus.name==in=(Afgehandeld,Gesloten)"
+_STATUS_MAP = {"open": _OPEN_STATUS, "closed": _CLOSED_STATUS}
+_STATUS_LABELS = {"open": "openstaande", "closed": "afgehandelde"}
+_INCIDENT_QUERY = "caller.emailAddress=='{email}' and {status}"
+
+# Alles wat een tool teruggeeft gaat als input naar het model: houd het compact
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+_WHITESPACE_RE = re.compile(r"\s+")
+_MAX_CONTENT = 500
+_MAX_FULL_CONTENT = 4000
+
+
+def _slim(item: Dict[str, Any], max_content: int = _MAX_CONTENT) -> Dict[str, Any]:
     """
-    Haal knowledge items op van Topdesk.
-    
+    Maak een knowledge item compact voordat het naar het model gaat.
+
+    Verwijdert lege velden, haalt HTML uit content en description, kort lange
+    teksten in en gebruikt de vertaling als het item zelf geen tekst heeft.
+
     Args:
-        limit: Maximum aantal knowledge items om op te halen (default: 5)
-    
+        item: Het knowledge item zoals Topdesk het teruggeeft
+        max_content: Maximum aantal tekens per tekstveld (default: _MAX_CONTENT)
+
     Returns:
-        Een lijst van knowledge items met title, description, content etc.
+        Het compacte knowledge item
     """
+    if not isinstance(item, dict):
+        return item
+    item = dict(item)
+    translation = item.pop("translation", None)
+    translated = translation.get("content") if isinstance(translation, dict) else None
+    if isinstance(translated, dict):
+        for key, value in translated.items():
+            if not item.get(key):
+                item[key] = value
+    elif translated and not item.get("content"):
+        item["content"] = translated
+
+    slim = {}
+    for key, value in item.items():
+        if isinstance(value, str):
+            if key in ("content", "description"):
+                value = _WHITESPACE_RE.sub(" ", html.unescape(_HTML_TAG_RE.sub(" ", value)))
+            value = value.strip()
+            if len(value) > max_content:
+                value = value[:max_content].rstrip() + "…"
+        if value is None or value == "" or value == [] or value == {}:
+            continue
+        slim[key] = value
+    return slim
+
+async def _call_topdesk(tool_context: Optional[ToolContext], method, **kwargs):
+    """
+    Voer een (blokkerende) TopdeskService methode uit in een worker thread, zodra
+    de topdesk_gate een plek vrij heeft. Sessies met meer events krijgen voorrang.
+
+    `method` is de ongebonden methode (bv. TopdeskService.load_incidents), zodat ook
+    het eventueel aanmaken van de service in de worker thread gebeurt.
+    """
+    priority = -len(tool_context.session.events) if tool_context is not None else 0
+    async with topdesk_gate.slot(priority):
+        return await asyncio.to_thread(lambda: method(_topdesk(), **kwargs))
+
+async def _call_zenya(method, *args, **kwargs):
+    """
+    Voer een (blokkerende) ZenyaService methode uit in een worker thread.
+
+    Net als bij _call_topdesk is `method` de ongebonden methode (bv. ZenyaService.load_content).
+    """
+    return await asyncio.to_thread(lambda: method(_zenya(), *args, **kwargs))
+
+# Custom functions voor Topdesk API
+@cached_tool(kb_cache, persistent=kb_store, stale_cache=stale_cache)
+async def get_knowledge_items(limit: int = 5, tool_context: Optional[ToolContext] = None) -> List[Dict[str, Any]]:
+    """Haal knowledge items op uit de Topdesk kennisbank."""
     try:
-        items = topdesk_service.load_knowledge_items(limit=limit)
-        return items
+        items = await _call_topdesk(tool_context, TopdeskService.load_knowledge_items, limit=limit)
+        return [_slim(item) for item in items]
     except Exception as e:
         logger.error(f"Error in get_knowledge_items: {str(e)}")
         return [{"error": f"Kon knowledge items niet ophalen: {str(e)}"}]
 
-def get_public_knowledge_items(limit: int = 5) -> List[Dict[str, Any]]:
-    """
-    Haal alleen publieke knowledge items op van Topdesk.
-    
-    Args:
-        limit: Maximum aantal knowledge items om op te halen (default: 5)
-    
-    Returns:
-        Een lijst van publieke knowledge items
-    """
+@cached_tool(kb_cache, persistent=kb_store, stale_cache=stale_cache)
+async def get_public_knowledge_items(limit: int = 5, tool_context: Optional[ToolContext] = None) -> List[Dict[str, Any]]:
+    """Haal publieke knowledge items op."""
     try:
-        items = topdesk_service.load_knowledge_items(limit=limit, public_only=True)
-        return items
+        items = await _call_topdesk(tool_context, TopdeskService.load_knowledge_items, limit=limit, public_only=True)
+        return [_slim(item) for item in items]
     except Exception as e:
         return [{"error": f"Kon publieke knowledge items niet ophalen: {str(e)}"}]
 
-def get_knowledge_item_by_id(identifier: str) -> Dict[str, Any]:
-    """
-    Haal een specifiek knowledge item op via ID.
-    
-    Args:
-        identifier: ID van het knowledge item
-    
-    Returns:
-        Het knowledge item als dictionary of None als niet gevonden
-    """
+@cached_tool(id_cache, negative_cache=not_found_cache, stale_cache=stale_cache)
+async def get_knowledge_item_by_id(identifier: str, tool_context: Optional[ToolContext] = None) -> Dict[str, Any]:
+    """Haal een knowledge item op via zijn ID."""
     try:
-        item = topdesk_service.load_knowledge_item_by_identifier(identifier)
+        item = await _call_topdesk(tool_context, TopdeskService.load_knowledge_item_by_identifier, identifier=identifier)
         if item:
-            return item
+            return _slim(item)
         else:
-            return {"error": f"Knowledge item met ID {identifier} niet gevonden"}
+            return NotFound(error=f"Knowledge item met ID {identifier} niet gevonden")
     except Exception as e:
         return {"error": f"Kon knowledge item {identifier} niet ophalen: {str(e)}"}
 
-def search_knowledge_items(search_term: str, limit: int = 10) -> List[Dict[str, Any]]:
-    """
-    Zoek knowledge items op basis van een zoekterm.
-    Deze functie voert een full-text search uit op titel, content en trefwoorden.
-    
-    Args:
-        search_term: Zoekterm om te gebruiken.
-        limit: Maximum aantal resultaten (default: 10)
-    
-    Returns:
-        Een lijst van gevonden knowledge items.
-    """
+@cached_tool(kb_cache, normalize=["search_term"], persistent=kb_store, stale_cache=stale_cache)
+async def search_knowledge_items(search_term: str, limit: int = 10, tool_context: Optional[ToolContext] = None) -> List[Dict[str, Any]]:
+    """Doorzoek titel, content en trefwoorden van de kennisbank op een zoekterm."""
     try:
         # DEFINITIEVE CORRECTIE 2: Dit API endpoint gebruikt de 'searchTerm' parameter
         # voor een full-text search, in plaats van een FIQL query op het 'title' veld.
-        items = topdesk_service.load_knowledge_items(
+        items = await _call_topdesk(
+            tool_context,
+            TopdeskService.load_knowledge_items,
             limit=limit,
             search_term=search_term, # Aangepast van 'query' naar 'search_term'
-            fields="title,description,keywords,creationDate,modificationDate"
+            fields=_KB_FIELDS_SEARCH
         )
         if not items:
             return [{"message": f"Geen kennisartikelen gevonden die '{search_term}' bevatten."}]
-        return items
+        return [_slim(item) for item in items]
     except Exception as e:
         return [{"error": f"Kon knowledge items niet doorzoeken met zoekterm '{search_term}': {str(e)}"}]
 
-def get_recent_knowledge_items(limit: int = 5) -> List[Dict[str, Any]]:
-    """
-    Haal recent aangemaakte of gewijzigde knowledge items op.
-    
-    Args:
-        limit: Maximum aantal items om op te halen (default: 5)
-    
-    Returns:
-        Een lijst van recent aangepaste knowledge items
-    """
+@cached_tool(kb_cache, persistent=kb_store, stale_cache=stale_cache)
+async def get_recent_knowledge_items(limit: int = 5, tool_context: Optional[ToolContext] = None) -> List[Dict[str, Any]]:
+    """Haal recent aangemaakte of gewijzigde knowledge items op."""
     try:
-        items = topdesk_service.load_modification_date(
+        items = await _call_topdesk(
+            tool_context,
+            TopdeskService.load_knowledge_items,
             limit=limit,
-            fields="title,description,creationDate,modificationDate"
+            fields=_KB_FIELDS_LIST
         )
-        return items
+        return [_slim(item) for item in items]
     except Exception as e:
         return [{"error": f"Kon recente knowledge items niet ophalen: {str(e)}"}]
 
-def get_concept_knowledge_items(limit: int = 10) -> List[Dict[str, Any]]:
-    """
-    Haal knowledge items op die nog in concept status zijn.
-    
-    Args:
-        limit: Maximum aantal items om op te halen (default: 10)
-    
-    Returns:
-        Een lijst van knowledge items in concept status
-    """
+@cached_tool(kb_cache, persistent=kb_store, stale_cache=stale_cache)
+async def get_overview(limit: int = 5, tool_context: Optional[ToolContext] = None) -> Dict[str, Any]:
+    """Haal recente en publieke knowledge items in één keer op."""
+    try:
+        recent, public = await asyncio.gather(
+            _call_topdesk(tool_context, TopdeskService.load_knowledge_items, limit=limit, fields=_KB_FIELDS_LIST),
+            _call_topdesk(
+                tool_context, TopdeskService.load_knowledge_items, limit=limit, fields=_KB_FIELDS_LIST, public_only=True
+            ),
+        )
+        return {
+            "recent_items": [_slim(item) for item in recent],
+            "public_items": [_slim(item) for item in public],
+        }
+    except Exception as e:
+        logger.error(f"Error in get_overview: {str(e)}")
+        return {"error": f"Kon kennisbank overzicht niet ophalen: {str(e)}"}
+
+async def get_concept_knowledge_items(limit: int = 10, tool_context: Optional[ToolContext] = None) -> List[Dict[str, Any]]:
+    """Haal knowledge items met status concept op."""
     try:
-        items = topdesk_service.load_modification_date(
+        items = await _call_topdesk(
+            tool_context,
+            TopdeskService.load_knowledge_items,
             limit=limit,
             query="status.name==in=(Concept)",
-            fields="title,description,creationDate,modificationDate"
+            fields=_KB_FIELDS_LIST
         )
-        return items
+        return [_slim(item) for item in items]
     except Exception as e:
         return [{"error": f"Kon concept knowledge items niet ophalen: {str(e)}"}]
 
-def get_knowledge_item_content(identifier: str) -> Dict[str, Any]:
-    """
-    Haal de volledige content van een knowledge item op.
-    
-    Args:
-        identifier: ID van het knowledge item
-    
-    Returns:
-        Het knowledge item met volledige content
-    """
+@cached_tool(id_cache, negative_cache=not_found_cache, stale_cache=stale_cache)
+async def get_knowledge_item_content(identifier: str, tool_context: Optional[ToolContext] = None) -> Dict[str, Any]:
+    """Haal de volledige content van een knowledge item op via zijn ID."""
     try:
-        item = topdesk_service.load_knowledge_item_by_identifier(
-            identifier,
-            fields="title,description,content,keywords,creationDate,modificationDate"
+        item = await _call_topdesk(
+            tool_context,
+            TopdeskService.load_knowledge_item_by_identifier,
+            identifier=identifier,
+            fields=_KB_FIELDS_FULL
         )
         if item:
-            return item
+            return _slim(item, max_content=_MAX_FULL_CONTENT)
         else:
-            return {"error": f"Knowledge item met ID {identifier} niet gevonden"}
+            return NotFound(error=f"Knowledge item met ID {identifier} niet gevonden")
     except Exception as e:
         return {"error": f"Kon knowledge item content {identifier} niet ophalen: {str(e)}"}
 
 
-def get_incidents_by_caller(caller_email: str, status: str = "open") -> List[Dict[str, Any]]:
-    """
-    Haal incidenten (tickets) op voor een specifieke medewerker op basis van e-mailadres.
-    Standaard worden alleen openstaande tickets opgehaald.
-
-    Args:
-        caller_email: Het e-mailadres van de medewerker (aanmelder).
-        status: De status van de tickets om op te filteren ('open' of 'closed'). Default is 'open'.
-
-    Returns:
-        Een lijst van incidenten die voldoen aan de criteria.
-    """
+async def get_incidents_by_caller(caller_email: str, status: str = "open", tool_context: Optional[ToolContext] = None) -> List[Dict[str, Any]]:
+    """Haal tickets van een medewerker op via e-mailadres; status is 'open' of 'closed'."""
+    status_query = _STATUS_MAP.get(status.lower())
+    if status_query is None:
+        return [{"error": f"Onbekende status '{status}', gebruik 'open' of 'closed'."}]
     try:
-        # FIQL query om te filteren op e-mailadres van de aanmelder en status
-        if status == "open":
-            status_query = "processingStatus.name!=in=(Afgehandeld,Gesloten)"
-        else:
-            status_query = "processingStatus.name==in=(Afgehandeld,Gesloten)"
-        
-        query = f"caller.emailAddress=='{caller_email}' and {status_query}"
-        
-        incidents = topdesk_service.load_incidents(
+        # FIQL query om te filteren op e-mailadres van de aanmelder en status.
+        # Quotes worden verwijderd zodat het e-mailadres de query niet kan afbreken.
+        query = _INCIDENT_QUERY.format(email=caller_email.replace("'", ""), status=status_query)
+
+        incidents = await _call_topdesk(
+            tool_context,
+            TopdeskService.load_incidents,
             query=query,
-            fields="number,briefDescription,processingStatus.name,operator.name,creationDate,targetDate",
+            fields=_INCIDENT_FIELDS,
             limit=20
         )
         if not incidents:
-            return [{"message": f"Geen {status}e tickets gevonden voor {caller_email}."}]
+            label = _STATUS_LABELS[status.lower()]
+            return [{"message": f"Er zijn geen {label} tickets gevonden voor {caller_email}."}]
         return incidents
     except Exception as e:
         logger.error(f"Error in get_incidents_by_caller: {str(e)}")
         return [{"error": f"Kon incidenten niet ophalen voor {caller_email}: {str(e)}"}]
 
-def get_incident_by_number(incident_number: str) -> Dict[str, Any]:
-    """
-    Haal een specifiek incident (ticket) op basis van het ticketnummer.
-
-    Args:
-        incident_number: Het volledige nummer van het incident (bv. 'I-2403-0012').
-
-    Returns:
-        De details van het gevonden incident of een foutmelding.
-    """
+@cached_tool(id_cache, negative_cache=not_found_cache)
+async def get_incident_by_number(incident_number: str, tool_context: Optional[ToolContext] = None) -> Dict[str, Any]:
+    """Haal een ticket op via zijn nummer (bv. 'I-2403-0012')."""
     try:
         query = f"number=='{incident_number}'"
-        incidents = topdesk_service.load_incidents(
+        incidents = await _call_topdesk(
+            tool_context,
+            TopdeskService.load_incidents,
             query=query,
-            fields="number,briefDescription,detailedDescription,processingStatus.name,operator.name,caller.dynamicName,creationDate,targetDate,action"
+            fields=_INCIDENT_DETAIL_FIELDS
         )
-        return incidents[0] if incidents else {"error": f"Incident {incident_number} niet gevonden."}
+        return incidents[0] if incidents else NotFound(error=f"Incident {incident_number} niet gevonden.")
     except Exception as e:
         logger.error(f"Error in get_incident_by_number: {str(e)}")
         return {"error": f"Kon incident {incident_number} niet ophalen: {str(e)}"}
 
+async def get_incidents_by_numbers(incident_numbers: List[str], tool_context: Optional[ToolContext] = None) -> List[Dict[str, Any]]:
+    """Haal de details van meerdere tickets tegelijk op via hun nummers."""
+    # Elk ticket gaat via get_incident_by_number, zodat de cache en de priority gate
+    # per ticket gelden; de aanroepen lopen gelijktijdig in plaats van na elkaar.
+    return list(await asyncio.gather(
+        *(get_incident_by_number(number, tool_context) for number in incident_numbers)
+    ))
+
 # Zenya service functions
-def get_zenya_documents(max_results: int = 10) -> List[Dict[str, Any]]:
-    """
-    Haal documenten op van Zenya.
-    
-    Args:
-        max_results: Maximum aantal documenten om op te halen (default: 10)
-    
-    Returns:
-        Een lijst van documenten met metadata
-    """
+async def get_zenya_documents(max_results: int = 10) -> List[Dict[str, Any]]:
+    """Haal documenten op uit Zenya."""
     try:
-        documents = zenya_service.collect_documents(max_results=max_results)
+        documents = await _call_zenya(ZenyaService.collect_documents, max_results=max_results)
         return documents
     except Exception as e:
         logger.error(f"Error in get_zenya_documents: {str(e)}")
         return [{"error": f"Kon Zenya documenten niet ophalen: {str(e)}"}]
 
-def search_zenya_documents(query: str, max_results: int = 10, portal_id: int = 119) -> List[Dict[str, Any]]:
-    """
-    Zoek documenten in Zenya op basis van een zoekterm.
-    
-    Args:
-        query: Zoekterm om te gebruiken
-        max_results: Maximum aantal resultaten (default: 10)
-        portal_id: Portal ID om in te zoeken (default: 119)
-    
-    Returns:
-        Een lijst van gevonden documenten
-    """
+async def search_zenya_documents(query: str, max_results: int = 10, portal_id: int = 119) -> List[Dict[str, Any]]:
+    """Zoek documenten in Zenya op een zoekterm."""
     try:
-        results = zenya_service.collect_dedicated_search_results(
+        results = await _call_zenya(
+            ZenyaService.collect_dedicated_search_results,
             query=query,
             max_results=max_results,
-            portal_id=portal_id
+            portal_id=portal_id,
+            # Met de standaard paden zijn de overige velden altijd leeg; stuur ze niet naar het model
+            fields=("source_item_id", "title")
         )
         if not results:
             return [{"message": f"Geen documenten gevonden voor zoekterm '{query}'."}]
@@ -251,102 +350,199 @@ def search_zenya_documents(query: str, max_results: int = 10, portal_id: int = 1
         logger.error(f"Error in search_zenya_documents: {str(e)}")
         return [{"error": f"Kon Zenya documenten niet doorzoeken met '{query}': {str(e)}"}]
 
-def get_zenya_document_by_id(document_id: str) -> Dict[str, Any]:
-    """
-    Download een specifiek document van Zenya.
-    
-    Args:
-        document_id: ID van het document om te downloaden
-    
-    Returns:
-        Het document content als bytes of een foutmelding
-    """
+async def get_zenya_document_by_id(document_id: str) -> Dict[str, Any]:
+    """Download een Zenya document via zijn ID."""
     try:
-        content = zenya_service.download_document(document_id)
+        # Alleen de grootte gaat naar het model, dus het document hoeft niet in het geheugen
+        with open(os.devnull, "wb") as sink:
+            size = await _call_zenya(ZenyaService.download_document, document_id, sink=sink)
         return {
             "document_id": document_id,
-            "content_size": len(content),
-            "message": f"Document {document_id} succesvol gedownload ({len(content)} bytes)"
+            "content_size": size,
+            "message": f"Document {document_id} succesvol gedownload ({size} bytes)"
         }
     except Exception as e:
         logger.error(f"Error in get_zenya_document_by_id: {str(e)}")
         return {"error": f"Kon document {document_id} niet downloaden: {str(e)}"}
 
-def get_zenya_content(limit: int = 10, offset: int = 0) -> Dict[str, Any]:
-    """
-    Haal content items op van Zenya API.
-    
-    Args:
-        limit: Maximum aantal items per pagina (default: 10)
-        offset: Offset voor paginering (default: 0)
-    
-    Returns:
-        De API response met content data
-    """
+async def get_zenya_content(limit: int = 10, offset: int = 0) -> Dict[str, Any]:
+    """Haal content items op uit Zenya met paginering."""
     try:
-        content = zenya_service.load_content(limit=limit, offset=offset)
+        content = await _call_zenya(ZenyaService.load_content, limit=limit, offset=offset)
         return content
     except Exception as e:
         logger.error(f"Error in get_zenya_content: {str(e)}")
         return {"error": f"Kon Zenya content niet ophalen: {str(e)}"}
 
+def clear_cache() -> Dict[str, Any]:
+    """Leeg de cache zodat de volgende opvragingen verse data ophalen."""
+    removed = clear_caches(kb_cache, id_cache, not_found_cache, stale_cache, kb_store)
+    if _topdesk_service is not None:
+        _topdesk_service.invalidate()
+    return {"message": f"Cache geleegd ({removed} entries verwijderd)"}
+
+# Snelle route: vragen waarvan de tool-aanroep vastligt worden zonder LLM beantwoord
+_INCIDENT_NUMBER_RE = re.compile(r"^I-\d{4}-\d{4}$", re.IGNORECASE)
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+# Alleen duidelijke opvraagvragen, zoals "mijn tickets" of "openstaande meldingen"
+_STATUS_WORDS = "openstaande|open|lopende|gesloten|afgehandelde|afgesloten"
+_TICKET_LOOKUP_RE = re.compile(
+    rf"\b(?:mijn|alle)\s+(?:(?P<status>{_STATUS_WORDS})\s+)?(?:tickets|meldingen)\b"
+    rf"|\b(?P<bare_status>{_STATUS_WORDS})\s+(?:tickets|meldingen)\b",
+    re.IGNORECASE,
+)
+_CLOSED_WORDS = frozenset({"gesloten", "afgehandelde", "afgesloten"})
+# Ontkenningen, actiewerkwoorden en hoe/waarom-vragen gaan altijd naar het model
+_LLM_WORDS_RE = re.compile(
+    r"\b(niet|geen|nooit|hoe|waarom|aanmaken|aan\s+te\s+maken|maak\w*|maken|heropen\w*|indienen|dien|"
+    r"sluit\w*|wijzig\w*|aanpassen|annuleer\w*|annuleren|verwijder\w*)\b",
+    re.IGNORECASE,
+)
+
+
+def _name(item: Dict[str, Any], key: str) -> str:
+    """Geef het 'name' veld van een genest Topdesk object, of '-' als het ontbreekt."""
+    value = item.get(key)
+    return (value.get("name") if isinstance(value, dict) else value) or "-"
+
+
+def _format_incident(incident: Dict[str, Any]) -> str:
+    """Formatteer één ticket als korte tekst voor de gebruiker."""
+    return (
+        f"**{incident.get('number')}**: {incident.get('briefDescription') or '-'}\n"
+        f"- Status: {_name(incident, 'processingStatus')}\n"
+        f"- Behandelaar: {_name(incident, 'operator')}\n"
+        f"- Aangemaakt: {incident.get('creationDate') or '-'}\n"
+        f"- Streefdatum: {incident.get('targetDate') or '-'}"
+    )
+
+
+async def fast_route(user_msg: str) -> Optional[str]:
+    """
+    Beantwoord eenvoudige ticketvragen direct, zonder het model aan te roepen.
+
+    Een bericht dat alleen uit een ticketnummer bestaat haalt dat ticket op; een bericht
+    met een e-mailadres en een duidelijke opvraagvraag als 'mijn tickets' of 'gesloten
+    meldingen' haalt de tickets van die medewerker op. Berichten met een ontkenning of
+    een actie (aanmaken, heropenen, ...) gaan altijd naar het model.
+
+    Args:
+        user_msg: Het bericht van de gebruiker
+
+    Returns:
+        Het antwoord voor de gebruiker, of None als het model de vraag moet afhandelen
+    """
+    message = user_msg.strip()
+
+    if _INCIDENT_NUMBER_RE.match(message):
+        incident = await get_incident_by_number(message.upper())
+        if "error" in incident:
+            return None
+        return _format_incident(incident)
+
+    email = _EMAIL_RE.search(message)
+    lookup = _TICKET_LOOKUP_RE.search(message)
+    if email and lookup and not _LLM_WORDS_RE.search(message):
+        adjective = (lookup.group("status") or lookup.group("bare_status") or "").lower()
+        status = "closed" if adjective in _CLOSED_WORDS else "open"
+        incidents = await get_incidents_by_caller(email.group(), status)
+        if any("error" in incident for incident in incidents):
+            return None
+        if "message" in incidents[0]:
+            return incidents[0]["message"]
+        label = _STATUS_LABELS[status]
+        return f"Je hebt {len(incidents)} {label} ticket(s):\n\n" + "\n\n".join(
+            _format_incident(incident) for incident in incidents
+        )
+
+    return None
+
+
+async def _fast_route_callback(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """
+    before_model_callback die fast_route probeert voor een nieuw gebruikersbericht.
+    Geeft None terug (en laat het model zijn werk doen) als de route niet van toepassing is.
+    """
+    if not llm_request.contents:
+        return None
+    last = llm_request.contents[-1]
+    # Alleen het eerste model-verzoek van een beurt; niet na een tool-antwoord
+    if last.role != "user" or not last.parts or any(part.function_response for part in last.parts):
+        return None
+    user_msg = "".join(part.text or "" for part in last.parts)
+    if not user_msg:
+        return None
+
+    answer = await fast_route(user_msg)
+    if answer is None:
+        return None
+    logger.info("Vraag beantwoord via de snelle route, zonder LLM")
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=answer)]))
+
+# Alle tools die de agent kan gebruiken, in de volgorde waarin ze aan het model worden aangeboden
+_TOOL_FNS = (
+    # Kennisbank tools
+    get_knowledge_items,
+    get_public_knowledge_items,
+    get_knowledge_item_by_id,
+    search_knowledge_items,
+    get_recent_knowledge_items,
+    get_overview,
+    get_concept_knowledge_items,
+    get_knowledge_item_content,
+
+    # Incident tools
+    get_incidents_by_caller,
+    get_incident_by_number,
+    get_incidents_by_numbers,
+
+    # Zenya tools
+    get_zenya_documents,
+    search_zenya_documents,
+    get_zenya_document_by_id,
+    get_zenya_content,
+
+    # Beheer tools
+    clear_cache,
+)
+
+@functools.lru_cache(maxsize=1)
+def _instruction() -> str:
+    """
+    Lees de instructie van de agent eenmalig in uit prompts/root_instruction.md.
+    """
+    return (files(__package__) / "prompts" / "root_instruction.md").read_text(encoding="utf-8")
+
+@functools.lru_cache(maxsize=1)
+def _tools() -> tuple:
+    """
+    Bouw de FunctionTools eenmalig op, zodat herhaald importeren ze niet opnieuw introspecteert.
+    """
+    return tuple(FunctionTool(fn) for fn in _TOOL_FNS)
+
+@functools.lru_cache(maxsize=1)
+def build_root_agent() -> LlmAgent:
+    """
+    Bouw de agent eenmalig op; volgende aanroepen geven dezelfde instantie terug.
+    """
+    return LlmAgent(
+        name="TopdeskLaurensAgent",
+        model="gemini-2.5-flash",
+        instruction=_instruction(),
+        description="Een agent die medewerkers van Zorgstichting Laurens helpt met de Topdesk Kennisbank, tickets en Zenya documenten.",
+        tools=list(_tools()),
+        before_model_callback=_fast_route_callback
+    )
+
 # Definieer de agent (ADK verwacht 'root_agent')
-root_agent = LlmAgent(
-    name="TopdeskLaurensAgent",
-    model="gemini-2.5-flash",
-    instruction="""
-Je bent een slimme en behulpzame assistent voor Zorgstichting Laurens. Jouw doel is om medewerkers snel en efficiënt te helpen met hun vragen over IT en facilitaire zaken door informatie uit Topdesk en Zenya op te halen.
-
-Je hebt drie hoofdtaken:
-1.  **Kennis verschaffen**: Doorzoek de Topdesk Kennisbank (Knowledge Base) voor handleidingen, procedures en antwoorden op veelgestelde vragen.
-2.  **Inzicht geven in Meldingen (Tickets)**: Geef medewerkers statusupdates over hun ingediende meldingen (incidenten) in Topdesk.
-3.  **Documenten beheren**: Zoek en haal documenten op uit het Zenya content management systeem.
-
-**BELANGRIJKE REGELS VOOR INTERACTIE:**
--   **Identificeer de gebruiker voor tickets**: Als een gebruiker vraagt naar "mijn tickets", "de status van mijn melding" of iets vergelijkbaars, vraag dan ALTIJD eerst naar hun e-mailadres. Zeg bijvoorbeeld: "Natuurlijk, ik kijk het graag voor je na. Wat is je e-mailadres?". Gebruik dit e-mailadres vervolgens met de `get_incidents_by_caller` tool.
--   **Wees duidelijk en beknopt**: Geef antwoorden in helder Nederlands. Gebruik lijsten of opsommingen om informatie overzichtelijk te presenteren.
--   **Verwijs naar de bron**: Als je informatie uit een kennisartikel haalt, vermeld dan de titel van het artikel. Als je ticketinformatie geeft, vermeld dan altijd het ticketnummer.
--   **Denk stapsgewijs**: Bepaal eerst of de vraag over de Kennisbank of over een Ticket gaat. Kies daarna de juiste tool.
-
-**Beschikbare Tools:**
-
-**// Kennisbank Tools**
-- `search_knowledge_items(search_term, limit)`: Doorzoek de kennisbank op een trefwoord. Gebruik dit voor algemene vragen zoals "hoe installeer ik een printer?".
-- `get_knowledge_item_by_id(identifier)`: Haal een specifiek artikel op als het ID bekend is.
-- `get_recent_knowledge_items(limit)`: Toon de meest recent gewijzigde kennisartikelen.
-- `get_public_knowledge_items(limit)`: Haal publieke kennisartikelen op.
-
-**// Incidenten (Tickets) Tools**
-- `get_incidents_by_caller(caller_email, status)`: Haal openstaande of gesloten tickets op voor een medewerker via hun e-mailadres. Gebruik `status='open'` voor actieve tickets en `status='closed'` voor afgeronde tickets.
-- `get_incident_by_number(incident_number)`: Haal de details van één specifiek ticket op aan de hand van het nummer (bv. 'I-2403-0012').
-
-**// Zenya Documenten Tools**
-- `get_zenya_documents(max_results)`: Haal een lijst van documenten op uit Zenya.
-- `search_zenya_documents(query, max_results, portal_id)`: Zoek documenten in Zenya op basis van een zoekterm.
-- `get_zenya_document_by_id(document_id)`: Download een specifiek document uit Zenya op basis van het ID.
-- `get_zenya_content(limit, offset)`: Haal content items op van de Zenya API met paginering.
-    """,
-    description="Een agent die medewerkers van Zorgstichting Laurens helpt met de Topdesk Kennisbank, tickets en Zenya documenten.",
-    tools=[
-        # Kennisbank tools (bestaand)
-        FunctionTool(get_knowledge_items),
-        FunctionTool(get_public_knowledge_items),
-        FunctionTool(get_knowledge_item_by_id),
-        FunctionTool(search_knowledge_items),
-        FunctionTool(get_recent_knowledge_items),
-        FunctionTool(get_concept_knowledge_items),
-        FunctionTool(get_knowledge_item_content),
-        
-        # NIEUWE Incident tools
-        FunctionTool(get_incidents_by_caller),
-        FunctionTool(get_incident_by_number),
-        
-        # Zenya tools
-        FunctionTool(get_zenya_documents),
-        FunctionTool(search_zenya_documents),
-        FunctionTool(get_zenya_document_by_id),
-        FunctionTool(get_zenya_content)
-    ]
+root_agent = build_root_agent()
+
+# De instructie en tool-declaraties zijn bij elke beurt gelijk. ADK vindt 'app' vóór
+# 'root_agent' en zet dat vaste begin van de prompt dan in een Gemini context cache.
+app = App(
+    name="json_agent",
+    root_agent=root_agent,
+    context_cache_config=ContextCacheConfig(ttl_seconds=3600, min_tokens=2048)
 )
 
 def main():
@@ -361,10 +557,12 @@ def main():
     print("   - Specifieke artikelen opzoeken via ID")
     print("   - Knowledge base doorzoeken op titel")
     print("   - Recente wijzigingen tonen")
+    print("   - Overzicht van recente en publieke artikelen in één keer")
     print("   - Concept artikelen ophalen")
     print("   - Volledige content van artikelen ophalen")
     print("   - Tickets opvragen per medewerker (op e-mail)")
     print("   - Specifieke tickets opzoeken via ticketnummer")
+    print("   - Meerdere tickets tegelijk opzoeken")
     print()
     print("   ZENYA:")
     print("   - Documenten ophalen uit Zenya")
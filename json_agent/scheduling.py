@@ -0,0 +1,96 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import threading
+from typing import AsyncIterator, List, Tuple
+
+# Setup Logger
+logger = logging.getLogger(__name__)
+
+
+class PriorityGate:
+    """
+    Limits the number of concurrent calls to a backend.
+
+    When all slots are taken, waiting callers are served by priority (lowest
+    value first) instead of arrival order, so a nearly finished session isn't
+    stuck behind a burst of new ones.
+
+    The gate is shared by callers on different event loops (every Runner.run
+    call runs its own loop on its own thread), so its state is guarded by a
+    thread lock and slots are handed over on the waiter's own loop.
+    """
+
+    def __init__(self, max_concurrent: int):
+        """
+        Initializes the gate.
+
+        Args:
+            max_concurrent (int): Maximum number of callers that may hold a slot at once.
+        """
+        self._available = max_concurrent
+        self._waiters: List[Tuple[int, int, asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: int = 0) -> AsyncIterator[None]:
+        """
+        Holds a slot for the duration of the `async with` block.
+
+        Args:
+            priority (int): Lower values are served first when callers have to wait.
+        """
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: int):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._available > 0 and not self._waiters:
+                self._available -= 1
+                return
+            future = loop.create_future()
+            # The counter keeps equal priorities in arrival order
+            entry = (priority, next(self._order), loop, future)
+            heapq.heappush(self._waiters, entry)
+            waiting = len(self._waiters)
+        logger.debug(f"Waiting for a slot with priority {priority} ({waiting} waiting)")
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = entry in self._waiters
+                if queued:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+            # Once dequeued the slot is ours: either it was already handed over, or
+            # _wake finds the future cancelled and passes the slot on itself
+            if not queued and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        # Hand the slot directly to the next waiter, on the loop it is waiting on
+        with self._lock:
+            while self._waiters:
+                _, _, loop, future = heapq.heappop(self._waiters)
+                try:
+                    loop.call_soon_threadsafe(self._wake, future)
+                    return
+                except RuntimeError:
+                    # The waiter's loop has been closed in the meantime
+                    continue
+            self._available += 1
+
+    def _wake(self, future: asyncio.Future):
+        if future.done():
+            # Cancelled before the hand-off arrived; pass the slot on
+            self._release()
+        else:
+            future.set_result(None)
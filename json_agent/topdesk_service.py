@@ -1,13 +1,53 @@
+import atexit
+import collections
+import itertools
 import os
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 import logging
 import json
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Dict, Any
+
+from cachetools import TTLCache
+
+# orjson parses the raw response bytes noticeably faster; the standard library is the fallback.
+# Both raise a json.JSONDecodeError (subclass) on invalid input.
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 # Setup Logger
 logger = logging.getLogger(__name__)
 
+# Intialize env variables once, when the module is imported
+load_dotenv()
+TOPDESK_KEY = os.environ.get("topdesk-key")
+TOPDESK_API_URL = os.environ.get("topdesk-api-url")
+
+# Attempts per page in paginated requests, and the delay before the first retry (doubled each time)
+PAGE_ATTEMPTS = 3
+PAGE_RETRY_DELAY = 0.5
+
+# Number of pages requested ahead of the page that is being parsed
+PREFETCH_WINDOW = 4
+
+# Seconds a cached knowledge item is used as-is, and seconds it is kept for conditional requests
+ITEM_FRESH_SECONDS = 300
+ITEM_CACHE_TTL = 3600
+
+# Knowledge item fields returned by default: metadata only, the content is by far the largest part
+DEFAULT_KB_FIELDS = "title,description,keywords,creationDate,modificationDate"
+
+# FIQL filter for knowledge items that are visible in the public knowledge base
+PUBLIC_ONLY_FIQL = "visibility.publicKnowledgeItem==true"
+
 
 class TopdeskService:
     def __init__(self):
@@ -17,18 +57,58 @@ class TopdeskService:
         Gets the Topdesk API key and URL from environment variables.
         """
 
-        # Intialize env varibles
-        load_dotenv()
-
         # Set env variables
-        self.api_key = os.environ["topdesk-key"]
-        self.api_url = os.environ["topdesk-api-url"]
+        if not TOPDESK_KEY or not TOPDESK_API_URL:
+            raise Exception("Missing environment variables 'topdesk-key' and/or 'topdesk-api-url'")
+        self.api_key = TOPDESK_KEY
+        self.api_url = TOPDESK_API_URL
 
-        # Token variables
+        # Token variables. The token is requested on the first call, not at startup
         self.token = None
-
-        # Create token
-        self.get_token()
+        self._headers = None
+        # Serializes token refreshes, so concurrent page requests don't all log in at once
+        self._token_lock = threading.Lock()
+
+        # Shared session, so connections (and their TLS handshake) are reused between requests.
+        # pool_maxsize covers the tools that call Topdesk concurrently from worker threads.
+        # Transient errors are retried with backoff (honouring Retry-After on 429/503); after the last
+        # attempt the response is returned as-is (raise_on_status=False), so the normal error handling still applies.
+        self.session = requests.Session()
+        retry = Retry(
+            total=5,
+            backoff_factor=0.3,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=["GET"],
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Ask for compressed responses explicitly. make_headers only offers br/zstd when a decoder
+        # is installed (brotli is in requirements.txt), so whatever Topdesk picks can be decompressed.
+        self.session.headers["Accept-Encoding"] = make_headers(accept_encoding=True)["accept-encoding"]
+        self.session.hooks["response"].append(self._log_encoding)
+        self._logged_encoding = False
+        atexit.register(self.session.close)
+
+        # Worker threads that fetch the next pages of a paginated request while the current one is parsed.
+        # Together with the pool size of the adapter this caps the number of concurrent page requests.
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="topdesk-prefetch")
+
+        # Knowledge items fetched by identifier, keyed on (identifier, fields), together with their
+        # ETag/Last-Modified. Entries younger than ITEM_FRESH_SECONDS are served without a request;
+        # older ones are revalidated with a conditional GET until they expire from the cache.
+        self._item_cache = TTLCache(maxsize=512, ttl=ITEM_CACHE_TTL)
+        self._item_cache_lock = threading.Lock()
+
+    def _log_encoding(self, response, *args, **kwargs):
+        """
+        Response hook that logs the Content-Encoding of the first JSON response, to verify compression is used.
+        """
+        if not self._logged_encoding and "json" in response.headers.get("Content-Type", ""):
+            self._logged_encoding = True
+            logger.debug("Topdesk responds with Content-Encoding: %s", response.headers.get("Content-Encoding"))
 
     def get_token(self):
         """
@@ -44,11 +124,20 @@ class TopdeskService:
         }
         # logger.info(f"Requesting authentication token from: {url}")
 
-        response = requests.get(url, headers=headers)
+        response = self.session.get(url, headers=headers)
 
         # When green flag (200), save token
         if response.status_code == 200:
-            self.token = response.text
+            token = response.text
+            # Build the headers once per token; every following request on the session carries them
+            self._headers = {
+                "Content-Type": "application/json",
+                "Authorization": f'TOKEN id="{token}", APIKEY {self.api_key}',
+            }
+            self.session.headers.update(self._headers)
+            # Publish the token last: _get reads it without the lock, and a request sent with
+            # the old header would get a 401 and reject the new token
+            self.token = token
             # logger.info(f"Authentication token retrieved successfully: {self.token}")
         else:
             raise Exception(
@@ -59,106 +148,213 @@ class TopdeskService:
         """
         Generates the request headers.
 
-        Passes the token to the header.
+        Passes the token to the header. The headers are built once per token in get_token().
 
         Returns:
             dict: Headers to use in the API request.
         """
+        if self.token is None:
+            self._refresh_token()
 
-        return {
-            "Content-Type": "application/json",
-            "Authorization": f'TOKEN id="{self.token}", APIKEY {self.api_key}',
-        }
+        return self._headers
 
-    def _load_paginated_data(self, endpoint_path: str, params: dict, limit: int = None):
+    def _refresh_token(self, rejected: str = None):
         """
-        Generic helper to load paginated data from a TOPdesk endpoint.
+        Requests a new token, unless another thread already did so.
+
+        Args:
+            rejected (str, optional): The token Topdesk rejected. A token is only requested
+                when the current one is missing or still this rejected one. Defaults to None.
+        """
+        with self._token_lock:
+            if self.token is None or self.token == rejected:
+                self.get_token()
+
+    def _get(self, url: str, params: dict = None, headers: dict = None) -> requests.Response:
+        """
+        Sends an authenticated GET request.
+
+        Requests a token first if there is none yet. When Topdesk rejects the
+        token (401, e.g. because it expired), a new token is requested and the
+        request is retried once.
+
+        Args:
+            url (str): The full request URL.
+            params (dict, optional): Query parameters for the request.
+            headers (dict, optional): Extra headers for this request only.
+
+        Returns:
+            requests.Response: The response.
+        """
+        if self.token is None:
+            self._refresh_token()
+
+        token = self.token
+        response = self.session.get(url, params=params, headers=headers)
+        if response.status_code == 401:
+            logger.info("Topdesk token was rejected, requesting a new one")
+            self._refresh_token(rejected=token)
+            response = self.session.get(url, params=params, headers=headers)
+        return response
+
+    def _iter_paginated_data(self, endpoint_path: str, params: dict, limit: int = None) -> Iterator[Dict[str, Any]]:
+        """
+        Generic helper that yields the items of a paginated TOPdesk endpoint one by one.
+
+        While a page is parsed, up to PREFETCH_WINDOW following pages are requested
+        concurrently when Topdesk reports the total count; without it only the next
+        page is requested ahead, as the end is only known once a page returns 200.
+        Pages beyond the limit (or the reported total) are never requested, and pages
+        still pending when the caller stops are cancelled.
 
         Args:
             endpoint_path (str): The path for the API endpoint (e.g., "/services/knowledge-base-v1/knowledgeItems").
             params (dict): A dictionary of query parameters for the request.
-            limit (int, optional): Maximum number of items to return. Defaults to None.
+            limit (int, optional): Number of items the caller is going to consume. Used to avoid
+                prefetching pages that won't be needed; the caller still has to stop itself. Defaults to None.
 
-        Returns:
-            list: A list of items from the API.
+        Yields:
+            dict: The items from the API.
         """
-        items = []
-        headers = self.get_headers()
-        
-        while True:
-            logger.info(f"Requesting data from endpoint '{endpoint_path}' with parameters: {params}")
-            response = requests.get(
-                f"{self.api_url}{endpoint_path}",
-                headers=headers,
-                params=params,
-            )
+        url = f"{self.api_url}{endpoint_path}"
+        page_size = params.get("page_size", 1000)
+        start = params.get("start", 0)
+        yielded = 0
+        total = None
+        # Prefetched pages in offset order, and the offset of the next page to submit
+        pending = collections.deque()
+        next_start = start + page_size
+        logged_fields = False
+
+        def fetch(start: int):
+            # Every page gets its own params dict, so a prefetch never shares mutable state
+            page_params = {**params, "start": start}
+            # %-style arguments, so the message is only formatted when the record is actually logged
+            logger.info("Requesting data from endpoint '%s' with parameters: %s", endpoint_path, page_params)
+            # A page that still fails after the adapter's retries (e.g. a dropped connection) is tried
+            # again on its own, so the pages that were already fetched don't have to be requested again
+            for attempt in range(PAGE_ATTEMPTS):
+                try:
+                    return self._get(url, params=page_params)
+                except requests.exceptions.RequestException as e:
+                    if attempt == PAGE_ATTEMPTS - 1:
+                        raise
+                    delay = PAGE_RETRY_DELAY * 2 ** attempt
+                    logger.warning(f"Request for page at {start} failed ({e}), retrying in {delay:.1f}s")
+                    time.sleep(delay)
+
+        def needed(page_start: int) -> bool:
+            # A page is worth requesting if it starts before the limit and before the known total
+            offset = page_start - params.get("start", 0)
+            return (limit is None or offset < limit) and (total is None or page_start < total)
+
+        response = fetch(start)
+        try:
+            while True:
+                if response.status_code not in [200, 206]: # 200 OK, 206 Partial Content
+                    logger.error(f"API request to '{endpoint_path}' failed: {response.status_code} - {response.text}")
+                    raise Exception(f"API request failed: {response.status_code} - {response.text}")
+
+                # 206 means more pages are available. Request the next pages before parsing this one,
+                # so their round trips overlap each other and the JSON decode.
+                has_more = response.status_code == 206
+                if has_more and total is None:
+                    total = self._total_count(response)
+                if total is not None and start + page_size >= total:
+                    # The total count shows this is the last page, so don't ask for an empty one
+                    has_more = False
+                if has_more:
+                    # Without a total a 206 only promises one more page, so don't run further ahead
+                    window = PREFETCH_WINDOW if total is not None else 1
+                    while len(pending) < window and needed(next_start):
+                        pending.append(self._prefetch_pool.submit(fetch, next_start))
+                        next_start += page_size
 
-            if response.status_code in [200, 206]: # 200 OK, 206 Partial Content
                 try:
-                    data = response.json()
-                    # The knowledgeItems endpoint returns a list under the 'item' key
-                    new_items = data.get("item", []) if isinstance(data, dict) else data
-                    # Debug: log available fields in first item
-                    if new_items and len(new_items) > 0:
-                        logger.info(f"Available fields in knowledge item: {list(new_items[0].keys())}")
-                    items.extend(new_items)
-
-                    if limit is not None and len(items) >= limit:
-                        return items[:limit]
-
-                    if response.status_code == 200: # Last page
-                        break
-
-                    # 206 means more pages are available, update 'start' for next request
-                    params["start"] = params.get("start", 0) + params.get("page_size", 1000)
+                    data = json_loads(response.content)
                 except json.JSONDecodeError:
                     logger.error(f"Invalid JSON response: {response.text}")
-                    break
-            else:
-                logger.error(f"API request to '{endpoint_path}' failed: {response.status_code} - {response.text}")
-                raise Exception(f"API request failed: {response.status_code} - {response.text}")
-        return items
-
-    def load_knowledge_items(self, limit: int = 10, search_term: str = None, query: str = None, **kwargs) -> List[Dict[str, Any]]:
-        """Haalt knowledge items op uit de Topdesk API."""
-        endpoint = f"{self.base_url}/services/knowledge-base-v1/knowledgeItems"
-        # Let op: De URL kan ook /tas/api/knowledgeItems zijn, afhankelijk van je Topdesk versie.
-        # De log laat zien dat /services/... de juiste is voor jou.
-        
-        headers = self.get_headers()
-        params = {
-            'page_size': limit,
-            'searchTerm': search_term,
-            'query': query,
-            'fields': kwargs.get('fields') # Zorg dat fields ook meegaat
-        }
-        
-        # Verwijder None values uit params zodat ze niet in de URL komen
-        params = {k: v for k, v in params.items() if v is not Bone}
-        
-        response = requests.get(endpoint, headers=headers, params=params)
-        
-        if response.status_code != 200:
-            # Verbeterde error logging
-            error_details = response.text
-            self.logger.error(f"API request to '{endpoint}' failed: {response.status_code} - {error_details}")
-            response.raise_for_status()
-            
-        return response.json()
+                    return
+                # Release the raw body before the items are handed out
+                response = None
+
+                # The knowledgeItems endpoint returns a list under the 'item' key
+                new_items = data.get("item", []) if isinstance(data, dict) else data
+                # Debug: log available fields of the first item, once per request
+                if new_items and not logged_fields:
+                    logger.debug("Available fields in item: %s", list(new_items[0].keys()))
+                    logged_fields = True
+                yield from new_items
+                yielded += len(new_items)
+
+                if not has_more or (limit is not None and yielded >= limit): # Last page or limit reached
+                    return
+
+                start += page_size
+                response = pending.popleft().result() if pending else fetch(start)
+        finally:
+            # Don't send requests for pages nobody is going to read
+            for future in pending:
+                future.cancel()
+
+    @staticmethod
+    def _total_count(response: requests.Response):
+        """
+        Reads the total number of items from the response headers, if Topdesk sent it.
 
-    def load_modification_date(
-            self, limit=None, fields="creationDate,modificationDate", query: str = None, page_size=1000, public_only: bool = False
-    ):
+        Looks at X-Total-Count first and falls back to the total in Content-Range
+        (e.g. "items 0-999/2500").
+
+        Args:
+            response (requests.Response): A page response.
+
+        Returns:
+            int: The total number of items, or None if it isn't known.
         """
-        Loads knowledge creationdate and modificationdate from TOPdesk with pagination.
+        total = response.headers.get("X-Total-Count")
+        if total is None:
+            content_range = response.headers.get("Content-Range", "")
+            total = content_range.rpartition("/")[2] if "/" in content_range else None
+        try:
+            return int(total) if total is not None else None
+        except ValueError:
+            return None
+
+    def _load_paginated_data(self, endpoint_path: str, params: dict, limit: int = None):
+        """
+        Generic helper to load paginated data from a TOPdesk endpoint.
 
         Args:
-            limit (int, optional): Maximum number of items. Default None.
+            endpoint_path (str): The path for the API endpoint (e.g., "/services/knowledge-base-v1/knowledgeItems").
+            params (dict): A dictionary of query parameters for the request.
+            limit (int, optional): Maximum number of items to return. Defaults to None.
+
+        Returns:
+            list: A list of items from the API.
+        """
+        return list(itertools.islice(self._iter_paginated_data(endpoint_path, params, limit), limit))
+
+    def load_knowledge_items(
+            self,
+            limit: int = 10,
+            fields: str = DEFAULT_KB_FIELDS,
+            search_term: str = None,
+            query: str = None,
+            page_size: int = 1000,
+            public_only: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Loads knowledge items from TOPdesk with pagination.
+
+        Args:
+            limit (int, optional): Maximum number of items. None loads all items. Defaults to 10.
             fields (str, optional): Comma-separated list of fields to get from server.
-                Defaults to "creationDate,modificationDate".
+                Defaults to metadata only; pass e.g. "content" explicitly when the text is needed.
+            search_term (str, optional): Full-text search term. Defaults to None.
             query (str, optional): Query to filter the response.
                 See TOPdesk API documentation for available fields and query syntax. Defaults to None.
             page_size (int): The number of item per page. max 1000.
+            public_only (bool): Only return items that are visible in the public knowledge base.
 
         Returns:
             list: A list of knowledge items.
@@ -166,17 +362,24 @@ class TopdeskService:
         Raises:
             Exception: If API request fails.
         """
-        # Ensure visibility field is requested if public_only is true
-        if public_only and "visibility" not in fields:
-            fields = f"{fields},visibility"
+        # Ensure visibility field is requested if public_only is true. Splitting the list also
+        # drops duplicate fields, so the same fields always give the same URL.
+        field_list = dict.fromkeys(field.strip() for field in fields.split(",") if field.strip())
+        if public_only:
+            field_list["visibility"] = None
+        fields = ",".join(field_list)
 
+        # Don't ask for a full page when only a few items are needed
+        if limit is not None:
+            page_size = min(page_size, limit)
         params = {"fields": fields, "page_size": page_size, "start": 0}
 
+        if search_term:
+            params["searchTerm"] = search_term
         if query:
             params["query"] = query
         if public_only:
-            public_query = "visibility.publicKnowledgeItem==true"
-            params["query"] = f"{params['query']} and {public_query}" if params.get("query") else public_query
+            params["query"] = f"{query} and {PUBLIC_ONLY_FIQL}" if query else PUBLIC_ONLY_FIQL
         return self._load_paginated_data(
             endpoint_path="/services/knowledge-base-v1/knowledgeItems", params=params, limit=limit
         )
@@ -197,19 +400,47 @@ class TopdeskService:
         Raises:
             Exception: If API request fails.
         """
-        headers = self.get_headers()
+        key = (identifier, fields)
+        with self._item_cache_lock:
+            cached = self._item_cache.get(key)
+        if cached is not None and time.monotonic() - cached["fetched_at"] < ITEM_FRESH_SECONDS:
+            logger.debug(f"Knowledge item '{identifier}' served from cache")
+            return cached["body"]
+
+        # Revalidate an older cached copy instead of downloading it again
+        conditional_headers = {}
+        if cached is not None:
+            if cached["etag"]:
+                conditional_headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                conditional_headers["If-Modified-Since"] = cached["last_modified"]
+
         params = {"fields": fields}
         url = f"{self.api_url}/services/knowledge-base-v1/knowledgeItems/{identifier}"
         logger.info(f"Requesting knowledge item by identifier '{identifier}' with URL: {url} and parameters: {params}")
 
-        response = requests.get(url, headers=headers, params=params)
+        response = self._get(url, params=params, headers=conditional_headers or None)
         logger.info(f"Response status: {response.status_code}, Response: {response.text[:200]}...")
 
-        if response.status_code == 200:
-            data = response.json()
+        if response.status_code == 304 and cached is not None:
+            logger.debug(f"Knowledge item '{identifier}' not modified, using cached copy")
+            with self._item_cache_lock:
+                self._item_cache[key] = {**cached, "fetched_at": time.monotonic()}
+            return cached["body"]
+        elif response.status_code == 200:
+            data = json_loads(response.content)
+            with self._item_cache_lock:
+                self._item_cache[key] = {
+                    "body": data,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "fetched_at": time.monotonic(),
+                }
             return data
         elif response.status_code == 404:
             logger.warning(f"Knowledge item with identifier '{identifier}' not found.")
+            # The item may have been removed, so drop every cached version of it
+            self.invalidate(identifier)
             return None
         elif response.status_code == 400:
             logger.warning(f"Bad request, controleer de parameters.  '{identifier}'.")
@@ -220,6 +451,21 @@ class TopdeskService:
                 f"API request failed: {response.status_code} - {response.text}"
             )
 
+    def invalidate(self, identifier: str = None):
+        """
+        Removes cached knowledge items, e.g. after the item was changed.
+
+        Args:
+            identifier (str, optional): The ID or number of the knowledge item to remove.
+                Defaults to None, which empties the whole cache.
+        """
+        with self._item_cache_lock:
+            if identifier is None:
+                self._item_cache.clear()
+                return
+            for key in [key for key in self._item_cache if key[0] == identifier]:
+                del self._item_cache[key]
+
     def load_incidents(self, query: str = None, fields: str = None, limit: int = 10, page_size: int = 1000):
         """
         Loads incidents from TOPdesk's incident API.
@@ -264,15 +510,15 @@ if __name__ == "__main__":
             else:
                 print("No data returned (load_knowledge_items).")
 
-            # Test load_knowledge_creation_date
-            creation_data = topdesk.load_modification_date(limit=10)
+            # Test load_knowledge_items
+            creation_data = topdesk.load_knowledge_items(limit=10, fields="creationDate,modificationDate")
             if creation_data:
-                print("Data received (load_knowledge_creation_date):")
+                print("Data received (load_knowledge_items):")
                 print(creation_data)
             else:
-                print("No data returned (load_knowledge_creation_date).")
+                print("No data returned (load_knowledge_items).")
 
-            creation_data = topdesk.load_modification_date(limit=10, query="status.name==in=(Concept)")
+            creation_data = topdesk.load_knowledge_items(limit=10, query="status.name==in=(Concept)")
             if creation_data:
                 print(creation_data)
     except Exception as e:
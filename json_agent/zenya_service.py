@@ -1,12 +1,68 @@
+import atexit
+import collections
 import os
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import logging
+from typing import Any, BinaryIO, Callable
+
+# Prefer orjson for (de)serializing JSON; fall back to the standard library when it isn't installed
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    from json import dumps as json_dumps, loads as json_loads
 
 # Setup Logger
 logger = logging.getLogger(__name__)
 
+# Intialize env variables once, when the module is imported
+load_dotenv()
+ZENYA_API_KEY = os.environ.get("zenya-api-key")
+ZENYA_API_URL = os.environ.get("zenya-api-url")
+ZENYA_USERNAME = os.environ.get("zenya-username")
+
+# Number of content pages requested concurrently by collect_documents
+PREFETCH_WINDOW = 4
+
+# Bytes per chunk when a document is streamed into a sink
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _compile_path(path: list) -> Callable[[dict], Any]:
+    """
+    Builds an accessor that retrieves a value from a nested dictionary using a list of keys (path).
+
+    Example: ["details", "contact", "email"] gives a function that returns item["details"]["contact"]["email"].
+
+    Args:
+        path (list): The keys to follow. An empty path or None gives an accessor that always returns None.
+
+    Returns:
+        Callable: Function that returns the value found at the path, or None if the path is not found.
+    """
+    if not path:
+        return lambda item: None
+    keys = tuple(path)
+
+    def get(item):
+        for key in keys:
+            # Like the old get_nested_value, only dicts are walked; lists and strings give None
+            if not isinstance(item, dict):
+                return None
+            try:
+                item = item[key]
+            except KeyError:
+                return None
+        return item
+
+    return get
+
 
 class ZenyaService:
     def __init__(self):
@@ -17,18 +73,53 @@ class ZenyaService:
         Sets the token lifetime.
         """
 
-        # Intialize env varibles
-        load_dotenv()
-
         # Set env variables
-        self.api_key = os.environ["zenya-api-key"]
-        self.api_url = os.environ["zenya-api-url"]
-        self.username = os.environ["zenya-username"]
+        if not ZENYA_API_KEY or not ZENYA_API_URL or not ZENYA_USERNAME:
+            raise Exception("Missing environment variables 'zenya-api-key', 'zenya-api-url' and/or 'zenya-username'")
+        self.api_key = ZENYA_API_KEY
+        self.api_url = ZENYA_API_URL
+        self.username = ZENYA_USERNAME
 
         # Token variables
         self.token = None
         self.token_expiration = None
         self.token_lifetime = 60  # in seconds
+        self._headers = None
+        # Serializes token refreshes, so concurrent page requests don't all request a token at once
+        self._token_lock = threading.Lock()
+
+        # Shared session, so connections (and their TLS handshake) are reused between requests,
+        # e.g. for every page in collect_documents. Transient errors on GET requests are retried
+        # with backoff, the same way as in TopdeskService.
+        self.session = requests.Session()
+        retry = Retry(
+            total=5,
+            backoff_factor=0.3,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=["GET"],
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"x-api-version": "5", "Content-Type": "application/json"})
+        # Compressed responses, limited to the encodings requests can decode here (br needs brotli)
+        self.session.headers["Accept-Encoding"] = make_headers(accept_encoding=True)["accept-encoding"]
+        self.session.hooks["response"].append(self._log_encoding)
+        self._logged_encoding = False
+        atexit.register(self.session.close)
+
+        # Worker threads that fetch content pages ahead of the one being processed
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WINDOW, thread_name_prefix="zenya-prefetch")
+
+    def _log_encoding(self, response, *args, **kwargs):
+        """
+        Response hook that logs the Content-Encoding of the first JSON response, to verify compression is used.
+        """
+        if not self._logged_encoding and "json" in response.headers.get("Content-Type", ""):
+            self._logged_encoding = True
+            logger.debug("Zenya responds with Content-Encoding: %s", response.headers.get("Content-Encoding"))
 
     def get_token(self):
         """
@@ -40,16 +131,25 @@ class ZenyaService:
         url = f"{self.api_url}/tokens"
 
         payload = {"api_key": self.api_key, "username": self.username}
-        headers = {"x-api-version": "5", "Content-Type": "application/json"}
-
-        response = requests.post(url, json=payload, headers=headers)
+        # x-api-version and Content-Type are set on the session; the (expired) token
+        # the session carries as well must not be sent along with the request for a new one
+        response = self.session.post(url, data=json_dumps(payload), headers={"Authorization": None})
 
         # When green flag (200), save token and create an expiration date
         if response.status_code == 200:
-            self.token = response.json()
+            token = json_loads(response.content)
+            # Build the headers once per token; every following request on the session carries them
+            self._headers = {
+                "Authorization": f"token {token}",
+                "x-api-version": "5",
+                "Content-Type": "application/json",
+            }
+            self.session.headers.update(self._headers)
+            # Publish the token last, so a thread that sees it alive also sends it
             self.token_expiration = datetime.now() + timedelta(
                 seconds=self.token_lifetime
             )
+            self.token = token
         else:
             raise Exception(
                 f"Something went wrong while creating the token: {response.status_code} - {response.text}"
@@ -64,6 +164,17 @@ class ZenyaService:
 
         return self.token is None or datetime.now() >= self.token_expiration
 
+    def _ensure_token(self):
+        """
+        Refreshes the token (and the session headers) when it is missing or expired.
+        """
+        if self.check_token_expired():
+            with self._token_lock:
+                # Another thread may have refreshed the token while we waited
+                if self.check_token_expired():
+                    # Overwrite old token
+                    self.get_token()
+
     def get_headers(self):
         """
         Generates the request headers.
@@ -71,20 +182,13 @@ class ZenyaService:
         Passes the token to the header.
 
         If token expired, it refreshes the token before returning the headers.
+        The headers are built once per token in get_token().
 
         Returns:
             dict: Headers to use in the API request.
         """
-
-        if self.check_token_expired():
-            # Overwrite old token
-            self.get_token()
-
-        return {
-            "Authorization": f"token {self.token}",
-            "x-api-version": "5",
-            "Content-Type": "application/json",
-        }
+        self._ensure_token()
+        return self._headers
 
     def load_content(self, limit=50, offset=0):
         """
@@ -114,7 +218,8 @@ class ZenyaService:
             "include_sub_type_field": "true",
         }
 
-        response = requests.get(url, headers=self.get_headers(), params=params)
+        self._ensure_token()
+        response = self.session.get(url, params=params)
 
         # When the API sends something other than a 200 message
         if response.status_code != 200:
@@ -122,7 +227,7 @@ class ZenyaService:
                 f"API request failed: {response.status_code} - {response.text}"
             )
 
-        return response.json()
+        return json_loads(response.content)
 
     def collect_documents(self, max_results: int = None):
         """
@@ -139,62 +244,103 @@ class ZenyaService:
         """
 
         documents = []
-        offset = 0
         limit = 50
-
-        while True:
-            data = self.load_content(limit=limit, offset=offset)
-            items = data.get("data", [])
-
-            # check if there are no items left.
-            if not items:
-                break
-
-            # Add items to list of documents
-            for item in items:
-                documents.append(
+        total = None
+        next_offset = 0
+
+        def needed(offset: int) -> bool:
+            # A page is worth requesting if it starts before max_results and before the known total
+            return (max_results is None or offset < max_results) and (total is None or offset < total)
+
+        # Pages are requested in offset order. Without a total only the next page is requested
+        # ahead, as a short page is the first sign of the end; pending ones are cancelled when we stop.
+        pending = collections.deque()
+        try:
+            while True:
+                if not pending:
+                    if not needed(next_offset):
+                        break
+                    pending.append(self._prefetch_pool.submit(self.load_content, limit=limit, offset=next_offset))
+                    next_offset += limit
+
+                data = pending.popleft().result()
+                items = data.get("data", [])
+                if total is None:
+                    total = self._total_count(data)
+
+                # A full page means there may be more: request the next ones before processing this one
+                if len(items) == limit:
+                    window = PREFETCH_WINDOW if total is not None else 1
+                    while len(pending) < window and needed(next_offset):
+                        pending.append(self._prefetch_pool.submit(self.load_content, limit=limit, offset=next_offset))
+                        next_offset += limit
+
+                # Add items to list of documents
+                documents.extend(
                     {
                         "source_item_id": item["source_item_id"],
                         "title": item["title"],
-                        "doc_type": item["sub_type_field"]["name"],
-                        "doc_type_id": item["sub_type_field"]["value_id"],
+                        "doc_type": (sub_type := item["sub_type_field"])["name"],
+                        "doc_type_id": sub_type["value_id"],
                         "last_modified_date_time": item.get("last_modified_date_time"),
                     }
+                    for item in items
                 )
-            # Stop when max is reached
-            if max_results is not None and len(documents) >= max_results:
-                break
-
-            # Update offset for next page
-            offset += limit
+                # Stop when max is reached, or after the last (short or empty) page
+                if max_results is not None and len(documents) >= max_results:
+                    break
+                if len(items) < limit:
+                    break
+        finally:
+            for future in pending:
+                future.cancel()
 
         logger.debug(
             f"Document collection completed, found {len(documents)} documents."
         )
         return documents
 
-    def download_document(self, document_id):
+    @staticmethod
+    def _total_count(data: dict):
+        """
+        Returns the total number of items the envelope of a content page reports, or None.
+        """
+        total = data.get("total_count")
+        return total if isinstance(total, int) else None
+
+    def download_document(self, document_id, sink: BinaryIO = None):
         """Download document based on the document_id
 
         Args:
             document_id (str): ID of the document to download.
+            sink (BinaryIO, optional): File-like object to stream the document into, in chunks,
+                instead of holding it in memory as a whole. Defaults to None.
 
         Returns:
-            bytes: Resonse content.
+            bytes | int: Resonse content, or the number of bytes written when a sink is given.
 
         Raises:
             Exception: If an error occurs during download.
         """
         url = f"{self.api_url}/documents/{document_id}/download"
         logger.debug(f"Downloading from URL: {url}")
-        response = requests.get(url, headers=self.get_headers())
-
-        if response.status_code == 200:
+        self._ensure_token()
+        with self.session.get(url, stream=True) as response:
+            if response.status_code != 200:
+                logger.error(f"Can't download {document_id}: {response.status_code}")
+                raise Exception(f"Can't download {document_id}: {response.status_code}")
+
+            if sink is None:
+                content = response.content
+                logger.debug(f"Successfully downloaded document {document_id}.")
+                return content
+
+            size = 0
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                sink.write(chunk)
+                size += len(chunk)
             logger.debug(f"Successfully downloaded document {document_id}.")
-            return response.content
-        else:
-            logger.error(f"Can't download {document_id}: {response.status_code}")
-            raise Exception(f"Can't download {document_id}: {response.status_code}")
+            return size
         
     def execute_dedicated_search(self, 
                                  query: str, 
@@ -240,14 +386,15 @@ class ZenyaService:
             params.update(extra_params)
 
         logger.debug(f"Uitvoeren dedicated search naar {url} met params: {params}")
-        response = requests.get(url, headers=self.get_headers(), params=params)
+        self._ensure_token()
+        response = self.session.get(url, params=params)
 
         if response.status_code != 200:
             raise Exception(
                 f"API verzoek via /search mislukt: {response.status_code} - {response.text}"
             )
         
-        return response.json()
+        return json_loads(response.content)
 
     def collect_dedicated_search_results(self, 
                                          query: str,
@@ -260,7 +407,8 @@ class ZenyaService:
                                          type_field_path: list = None,
                                          doc_type_path: list = None,
                                          doc_type_id_path: list = None,
-                                         modified_date_path: list = None
+                                         modified_date_path: list = None,
+                                         fields: tuple = None
                                         ):
         """
         Verzamelt zoekresultaten van het Zenya /search endpoint met token-gebaseerde paginering.
@@ -271,33 +419,35 @@ class ZenyaService:
             search_scope (str): Searchscope - in_portal or outside_portal.
             collection_id (int, optional): Collection ID.
             max_results (int, optioneel): Maximum number of results to collect.
+            fields (tuple, optional): Keys to include in each result (e.g. ("source_item_id", "title")).
+                Defaults to None, which includes all keys.
         Returns:
             list: List of search results.
+
+        Raises:
+            ValueError: If `fields` contains an unknown key.
         """
         search_results = []
         current_continuation_token = None
         has_more_pages = True
 
-
-        def get_nested_value(item, path):
-            """
-            Retrieves a value from a nested dictionary using a list of keys (path).
-
-            Example: ["details", "contact", "email"] to get item["details"]["contact"]["email"].
-
-            Returns:
-                The value found at the specified path, or None if the path is invalid or the value is not found.
-            """
-            if not path: 
-                return None
-            current = item
-            for key in path:
-                # Check if the current level is a dictionary and the key exists.
-                if isinstance(current, dict) and key in current:
-                    current = current[key]
-                else:
-                    return None
-            return current # Return the value found at the end of the path.
+        # The paths are the same for every item, so build their accessors once
+        accessors = {
+            "source_item_id": lambda item: item.get(id_field),
+            "title": lambda item: item.get(title_field),
+            "type": _compile_path(type_field_path),
+            "doc_type": _compile_path(doc_type_path),
+            "doc_type_id": _compile_path(doc_type_id_path),
+            "last_modified_date_time": _compile_path(modified_date_path),
+        }
+        if fields is not None:
+            unknown = set(fields) - accessors.keys()
+            if unknown:
+                raise ValueError(f"Unknown search result fields: {sorted(unknown)}")
+            accessors = {key: accessors[key] for key in fields}
+        accessors = tuple(accessors.items())
+        # Only attach the raw API item when debug logging is on (also when set on a parent logger)
+        include_raw = logger.isEnabledFor(logging.DEBUG)
 
         # Loop to get the search results for every page
         while has_more_pages:
@@ -317,15 +467,9 @@ class ZenyaService:
                  items = []
 
             for item in items:
-                processed_item = {
-                    "source_item_id": item.get(id_field),
-                    "title": item.get(title_field),
-                    "type": get_nested_value(item, type_field_path),
-                    "doc_type": get_nested_value(item, doc_type_path),
-                    "doc_type_id": get_nested_value(item, doc_type_id_path),
-                    "last_modified_date_time": get_nested_value(item, modified_date_path),
-                    "raw_item_details_for_debug": item if logger.level == logging.DEBUG else "Set logger to DEBUG"
-                }
+                processed_item = {key: get(item) for key, get in accessors}
+                if include_raw:
+                    processed_item["raw_item_details_for_debug"] = item
                 search_results.append(processed_item)
                 
                 if max_results is not None and len(search_results) >= max_results:
@@ -343,10 +487,6 @@ class ZenyaService:
             else:
                 has_more_pages = False
                 # logger.debug("No next continuationToken found, end of pagination.")
-            
-            if not items and not next_token_candidate : # Final check to stop
-                # logger.debug("No items on this page and no next token. Quit.")
-                has_more_pages = False
 
 
         # logger.info(
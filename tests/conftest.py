@@ -0,0 +1,8 @@
+import os
+
+# The services read their configuration at import time
+os.environ.setdefault("topdesk-key", "test-key")
+os.environ.setdefault("topdesk-api-url", "https://topdesk.test")
+os.environ.setdefault("zenya-api-key", "test-key")
+os.environ.setdefault("zenya-api-url", "https://zenya.test")
+os.environ.setdefault("zenya-username", "test-user")
@@ -0,0 +1,207 @@
+import asyncio
+import threading
+
+import pytest
+from cachetools import TTLCache
+
+from json_agent.cache import NotFound, SqliteStore, cached_tool, clear_caches
+
+
+def test_results_are_cached():
+    calls = []
+
+    @cached_tool(TTLCache(16, 60))
+    async def tool(x):
+        calls.append(x)
+        return {"x": x}
+
+    assert asyncio.run(tool(1)) == {"x": 1}
+    assert asyncio.run(tool(x=1)) == {"x": 1}
+    assert calls == [1]
+
+
+def test_normalized_queries_share_a_key():
+    calls = []
+
+    @cached_tool(TTLCache(16, 60), normalize=("query",))
+    async def search(query):
+        calls.append(query)
+        return [query]
+
+    asyncio.run(search("Hoe reset ik mijn wachtwoord?"))
+    asyncio.run(search("wachtwoord reset"))
+    assert len(calls) == 1
+
+
+def test_errors_are_not_cached():
+    calls = []
+
+    @cached_tool(TTLCache(16, 60))
+    async def tool(x):
+        calls.append(x)
+        return {"error": "Topdesk is down"}
+
+    asyncio.run(tool(1))
+    asyncio.run(tool(1))
+    assert calls == [1, 1]
+
+
+def test_calls_are_coalesced_within_a_loop():
+    calls = []
+
+    @cached_tool(TTLCache(16, 60))
+    async def tool(x):
+        calls.append(x)
+        await asyncio.sleep(0.05)
+        return {"x": x}
+
+    async def main():
+        return await asyncio.gather(tool(1), tool(1))
+
+    assert asyncio.run(main()) == [{"x": 1}, {"x": 1}]
+    assert calls == [1]
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_call():
+    @cached_tool(TTLCache(16, 60))
+    async def tool(x):
+        await asyncio.sleep(0.05)
+        return {"x": x}
+
+    async def main():
+        first = asyncio.create_task(tool(1))
+        second = asyncio.create_task(tool(1))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == {"x": 1}
+
+
+def test_sync_tools_are_rejected():
+    with pytest.raises(TypeError):
+        @cached_tool(TTLCache(16, 60))
+        def tool(x):
+            return {"x": x}
+
+def test_concurrent_calls_on_different_loops():
+    # Runner.run runs every call with asyncio.run on its own thread
+    started = threading.Barrier(2)
+    results, errors = [], []
+
+    @cached_tool(TTLCache(16, 60))
+    async def tool(x):
+        await asyncio.sleep(0.2)
+        return {"x": x}
+
+    async def call():
+        started.wait()
+        return await tool(1)
+
+    def run():
+        try:
+            results.append(asyncio.run(call()))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert errors == []
+    assert results == [{"x": 1}, {"x": 1}]
+
+
+def test_not_found_goes_to_the_negative_cache():
+    cache, negative = TTLCache(16, 60), TTLCache(16, 60)
+    calls = []
+
+    @cached_tool(cache, negative_cache=negative)
+    async def tool(x):
+        calls.append(x)
+        return NotFound(error="Niet gevonden")
+
+    assert asyncio.run(tool(1)) == {"error": "Niet gevonden"}
+    assert asyncio.run(tool(1)) == {"error": "Niet gevonden"}
+    assert calls == [1]
+    assert len(cache) == 0 and len(negative) == 1
+
+
+def test_tool_context_is_not_part_of_the_key():
+    calls = []
+
+    @cached_tool(TTLCache(16, 60))
+    async def tool(x, tool_context=None):
+        calls.append(x)
+        return {"x": x}
+
+    asyncio.run(tool(1, tool_context=object()))
+    asyncio.run(tool(1, tool_context=object()))
+    assert calls == [1]
+
+
+def test_results_reach_the_persistent_store(tmp_path):
+    store = SqliteStore(str(tmp_path / "cache.db"), ttl=60)
+
+    @cached_tool(TTLCache(16, 60), persistent=store)
+    async def tool(x):
+        return {"x": x}
+
+    asyncio.run(tool(1))
+    assert store.get(["tool", 1]) == {"x": 1}
+
+    @cached_tool(TTLCache(16, 60), persistent=store)
+    async def tool(x):
+        raise AssertionError("should be served from the persistent store")
+
+    assert asyncio.run(tool(1)) == {"x": 1}
+
+
+def test_persistent_hits_are_kept_in_memory(tmp_path):
+    store = SqliteStore(str(tmp_path / "cache.db"), ttl=60)
+    store.set(["tool", 1], {"x": 1})
+    cache = TTLCache(16, 60)
+
+    @cached_tool(cache, persistent=store)
+    async def tool(x):
+        raise AssertionError("should be served from the persistent store")
+
+    assert asyncio.run(tool(1)) == {"x": 1}
+    assert cache[("tool", 1)] == {"x": 1}
+
+
+def test_clear_caches_counts_every_tier(tmp_path):
+    store = SqliteStore(str(tmp_path / "cache.db"), ttl=60)
+    store.set(["tool", 1], {"x": 1})
+    cache = TTLCache(16, 60)
+    cache[("tool", 2)] = {"x": 2}
+
+    assert clear_caches(cache, None, store) == 2
+    assert len(cache) == 0 and len(store) == 0
+
+
+def test_sqlite_store_is_capped(tmp_path):
+    store = SqliteStore(str(tmp_path / "cache.db"), ttl=60, max_entries=10)
+    for i in range(SqliteStore.EVICT_EVERY):
+        store.set(["key", i], i)
+
+    assert len(store) == 10
+    # The entries closest to expiring go first
+    assert store.get(["key", 0]) is None
+    assert store.get(["key", SqliteStore.EVICT_EVERY - 1]) == SqliteStore.EVICT_EVERY - 1
+
+
+def test_stale_result_is_served_after_an_error():
+    cache, stale = TTLCache(16, 60), TTLCache(16, 60)
+    results = [{"x": 1}, {"error": "Topdesk is down"}]
+
+    @cached_tool(cache, stale_cache=stale)
+    async def tool(x):
+        return results.pop(0)
+
+    assert asyncio.run(tool(1)) == {"x": 1}
+    cache.clear()
+    assert asyncio.run(tool(1)) == {"x": 1}
+    assert results == []
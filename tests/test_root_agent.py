@@ -0,0 +1,49 @@
+import asyncio
+import importlib
+from unittest import mock
+
+import pytest
+
+# json_agent.root_agent is shadowed by the agent the package exports
+root_agent = importlib.import_module("json_agent.root_agent")
+
+
+def _fast_route(message: str, incidents=None):
+    lookup = mock.AsyncMock(return_value=incidents or [{"number": "I-2610-0001", "briefDescription": "VPN"}])
+    with mock.patch.object(root_agent, "get_incidents_by_caller", lookup):
+        answer = asyncio.run(root_agent.fast_route(message))
+    return answer, lookup
+
+
+@pytest.mark.parametrize("message, status", [
+    ("Mijn tickets a@b.nl", "open"),
+    ("Toon mijn openstaande meldingen, a@b.nl", "open"),
+    ("Wat zijn mijn gesloten tickets? a@b.nl", "closed"),
+    ("afgehandelde meldingen voor a@b.nl", "closed"),
+])
+def test_ticket_lookups_skip_the_model(message, status):
+    answer, lookup = _fast_route(message)
+
+    lookup.assert_awaited_once_with("a@b.nl", status)
+    assert "I-2610-0001" in answer
+
+
+@pytest.mark.parametrize("message", [
+    "Welke meldingen zijn nog niet afgehandeld? a@b.nl",
+    "Hoe maak ik een nieuwe melding aan? a@b.nl",
+    "Mijn ticket I-2610-0001 is niet opgelost, kun je het heropenen? a@b.nl",
+    "Kun je mijn tickets sluiten? a@b.nl",
+    "Mijn tickets",
+])
+def test_other_questions_go_to_the_model(message):
+    answer, lookup = _fast_route(message)
+
+    assert answer is None
+    lookup.assert_not_awaited()
+
+
+def test_no_tickets_message_is_passed_on():
+    message = [{"message": "Er zijn geen afgehandelde tickets gevonden voor a@b.nl."}]
+    answer, _ = _fast_route("mijn gesloten tickets a@b.nl", incidents=message)
+
+    assert answer == "Er zijn geen afgehandelde tickets gevonden voor a@b.nl."
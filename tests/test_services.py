@@ -0,0 +1,324 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlsplit
+from unittest import mock
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from json_agent.topdesk_service import TopdeskService
+from json_agent.zenya_service import ZenyaService, _compile_path
+
+
+def _response(status_code: int, content: bytes = b"") -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    return response
+
+
+def _run_threads(target, count: int = 10, stagger: float = 0.0):
+    barrier = threading.Barrier(count)
+
+    def run(index: int):
+        barrier.wait()
+        time.sleep(index * stagger)
+        target()
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+
+class _SlowHeaders(CaseInsensitiveDict):
+    # Widens the window between a new token being set and the session sending it
+    def update(self, *args, **kwargs):
+        time.sleep(0.1)
+        super().update(*args, **kwargs)
+
+
+def _topdesk_send(logins):
+    def send(session, request, **kwargs):
+        if request.url.endswith("/tas/api/login/operator"):
+            logins.append(request.headers["Authorization"])
+            time.sleep(0.05)
+            return _response(200, b"new")
+        return _response(200 if 'id="new"' in request.headers["Authorization"] else 401, b"[]")
+    return send
+
+
+def test_topdesk_rejected_token_is_refreshed_once():
+    service = TopdeskService()
+    service.token = "old"
+    service.session.headers["Authorization"] = 'TOKEN id="old", APIKEY test-key'
+    logins = []
+
+    with mock.patch.object(requests.Session, "send", _topdesk_send(logins)):
+        _run_threads(lambda: service._get(f"{service.api_url}/tas/api/incidents"))
+
+    assert logins == ["Basic test-key"]
+    assert service.token == "new"
+
+
+def test_topdesk_token_is_published_after_the_session_headers():
+    service = TopdeskService()
+    service.token = "old"
+    service.session.headers = _SlowHeaders({"Authorization": 'TOKEN id="old", APIKEY test-key'})
+    logins = []
+
+    with mock.patch.object(requests.Session, "send", _topdesk_send(logins)):
+        # Later threads arrive while the first refresh is still updating the headers
+        _run_threads(lambda: service._get(f"{service.api_url}/tas/api/incidents"), count=4, stagger=0.05)
+
+    assert logins == ["Basic test-key"]
+
+
+def test_zenya_token_is_requested_once():
+    service = ZenyaService()
+    token_requests = []
+
+    def send(session, request, **kwargs):
+        token_requests.append(request.url)
+        time.sleep(0.05)
+        return _response(200, b'"new"')
+
+    with mock.patch.object(requests.Session, "send", send):
+        _run_threads(service.get_headers)
+
+    assert len(token_requests) == 1
+
+
+def test_zenya_token_request_does_not_send_the_old_token():
+    service = ZenyaService()
+    service.session.headers["Authorization"] = "token old"
+    token_requests = []
+
+    def send(session, request, **kwargs):
+        token_requests.append(request.headers)
+        return _response(200, b'"new"')
+
+    with mock.patch.object(requests.Session, "send", send):
+        service.get_token()
+
+    assert "Authorization" not in token_requests[0]
+    assert service.session.headers["Authorization"] == "token new"
+
+
+def _topdesk_pages(count: int, offsets: list, total_header: dict = None, release: threading.Event = None):
+    # Full pages come back as 206 Partial Content, the short (or empty) last page as 200
+    def send(session, request, **kwargs):
+        query = parse_qs(urlsplit(request.url).query)
+        start, page_size = int(query["start"][0]), int(query["page_size"][0])
+        offsets.append(start)
+        if release is not None and start > 0:
+            release.wait(timeout=5)
+        response = _response(
+            206 if start + page_size <= count else 200,
+            json.dumps([{"id": i} for i in range(start, min(start + page_size, count))]).encode(),
+        )
+        response.headers.update(total_header or {})
+        return response
+    return send
+
+
+def _topdesk_service() -> TopdeskService:
+    service = TopdeskService()
+    service.token = "token"
+    return service
+
+
+def test_topdesk_pagination_without_a_total_runs_one_page_ahead():
+    service, offsets = _topdesk_service(), []
+
+    with mock.patch.object(requests.Session, "send", _topdesk_pages(25, offsets)):
+        items = service._load_paginated_data("/incidents", {"page_size": 10})
+
+    assert len(items) == 25
+    assert offsets == [0, 10, 20]
+
+
+def test_topdesk_pagination_stops_at_the_reported_total():
+    for header in ({"X-Total-Count": "30"}, {"Content-Range": "items 0-9/30"}):
+        service, offsets = _topdesk_service(), []
+
+        with mock.patch.object(requests.Session, "send", _topdesk_pages(30, offsets, header)):
+            items = service._load_paginated_data("/incidents", {"page_size": 10})
+
+        # The last page is full and comes back as 206, but the total shows nothing follows
+        assert len(items) == 30
+        assert sorted(offsets) == [0, 10, 20]
+
+
+def test_topdesk_pagination_prefetches_within_the_limit():
+    service, offsets = _topdesk_service(), []
+
+    with mock.patch.object(requests.Session, "send", _topdesk_pages(100, offsets, {"X-Total-Count": "100"})):
+        items = service._load_paginated_data("/incidents", {"page_size": 10}, limit=25)
+
+    assert [item["id"] for item in items] == list(range(25))
+    assert sorted(offsets) == [0, 10, 20]
+
+
+def test_topdesk_pagination_cancels_pending_pages():
+    service, offsets = _topdesk_service(), []
+    service._prefetch_pool = ThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+
+    with mock.patch.object(requests.Session, "send", _topdesk_pages(100, offsets, {"X-Total-Count": "100"}, release)):
+        pages = service._iter_paginated_data("/incidents", {"page_size": 10})
+        next(pages)
+        # Stopping early cancels the prefetched pages that haven't started yet
+        pages.close()
+        release.set()
+        service._prefetch_pool.shutdown(wait=True)
+
+    assert offsets == [0, 10]
+
+
+def test_knowledge_item_is_revalidated_with_its_etag():
+    service = _topdesk_service()
+    requests_sent = []
+    responses = [
+        _response(200, b'{"title": "VPN"}'),
+        _response(304),
+        _response(200, b'{"title": "VPN instellen"}'),
+    ]
+    responses[0].headers.update({"ETag": '"v1"', "Last-Modified": "Mon, 05 Oct 2026 08:00:00 GMT"})
+
+    def send(session, request, **kwargs):
+        requests_sent.append(request.headers)
+        return responses.pop(0)
+
+    with mock.patch.object(requests.Session, "send", send):
+        assert service.load_knowledge_item_by_identifier("KI 0001") == {"title": "VPN"}
+        # Fresh entries are served without a request
+        assert service.load_knowledge_item_by_identifier("KI 0001") == {"title": "VPN"}
+        assert len(requests_sent) == 1
+
+        with mock.patch("json_agent.topdesk_service.ITEM_FRESH_SECONDS", 0):
+            assert service.load_knowledge_item_by_identifier("KI 0001") == {"title": "VPN"}
+            assert service.load_knowledge_item_by_identifier("KI 0001") == {"title": "VPN instellen"}
+
+    assert "If-None-Match" not in requests_sent[0]
+    assert requests_sent[1]["If-None-Match"] == '"v1"'
+    assert requests_sent[1]["If-Modified-Since"] == "Mon, 05 Oct 2026 08:00:00 GMT"
+
+
+def test_missing_knowledge_item_is_dropped_from_the_cache():
+    service = _topdesk_service()
+    responses = [_response(200, b'{"title": "VPN"}'), _response(404)]
+
+    with mock.patch.object(requests.Session, "send", lambda session, request, **kwargs: responses.pop(0)):
+        service.load_knowledge_item_by_identifier("KI 0001")
+        with mock.patch("json_agent.topdesk_service.ITEM_FRESH_SECONDS", 0):
+            assert service.load_knowledge_item_by_identifier("KI 0001") is None
+
+    assert len(service._item_cache) == 0
+
+
+def _knowledge_item_queries(service: TopdeskService, **kwargs) -> dict:
+    queries = []
+
+    def send(session, request, **send_kwargs):
+        queries.append(parse_qs(urlsplit(request.url).query))
+        return _response(200, b'{"item": []}')
+
+    with mock.patch.object(requests.Session, "send", send):
+        service.load_knowledge_items(**kwargs)
+    return queries[0]
+
+
+def test_knowledge_items_public_only():
+    service = _topdesk_service()
+
+    query = _knowledge_item_queries(service, public_only=True)
+    assert query["query"] == ["visibility.publicKnowledgeItem==true"]
+    assert query["fields"] == ["title,description,keywords,creationDate,modificationDate,visibility"]
+
+    query = _knowledge_item_queries(service, query="archived==false", public_only=True)
+    assert query["query"] == ["archived==false and visibility.publicKnowledgeItem==true"]
+
+
+def test_knowledge_items_page_size_and_search_term():
+    query = _knowledge_item_queries(_topdesk_service(), limit=5, search_term="vpn")
+
+    assert query["page_size"] == ["5"]
+    assert query["searchTerm"] == ["vpn"]
+    assert "query" not in query
+
+
+def test_knowledge_items_fields_are_deduplicated():
+    service = _topdesk_service()
+
+    query = _knowledge_item_queries(service, fields="title, title,description,,visibility")
+    assert query["fields"] == ["title,description,visibility"]
+
+    # A visibility field that is already requested isn't added a second time
+    query = _knowledge_item_queries(service, fields="visibility,title", public_only=True)
+    assert query["fields"] == ["visibility,title"]
+
+
+def _zenya_pages(count: int, offsets: list, total: bool = False):
+    def send(session, request, **kwargs):
+        query = parse_qs(urlsplit(request.url).query)
+        offset, limit = int(query["offset"][0]), int(query["limit"][0])
+        offsets.append(offset)
+        items = [
+            {"source_item_id": i, "title": f"Document {i}", "sub_type_field": {"name": "Protocol", "value_id": 1}}
+            for i in range(offset, min(offset + limit, count))
+        ]
+        page = {"data": items, "total_count": count} if total else {"data": items}
+        return _response(200, json.dumps(page).encode())
+    return send
+
+
+def _zenya_service() -> ZenyaService:
+    service = ZenyaService()
+    service.token = "token"
+    service.token_expiration = datetime.now() + timedelta(minutes=5)
+    return service
+
+
+def test_zenya_collection_stops_at_the_short_last_page():
+    service, offsets = _zenya_service(), []
+
+    with mock.patch.object(requests.Session, "send", _zenya_pages(120, offsets)):
+        documents = service.collect_documents()
+
+    assert len(documents) == 120
+    assert offsets == [0, 50, 100]
+
+
+def test_zenya_collection_prefetches_up_to_the_reported_total():
+    service, offsets = _zenya_service(), []
+
+    with mock.patch.object(requests.Session, "send", _zenya_pages(300, offsets, total=True)):
+        documents = service.collect_documents()
+
+    assert len(documents) == 300
+    assert sorted(offsets) == [0, 50, 100, 150, 200, 250]
+
+
+def test_zenya_collection_respects_max_results():
+    service, offsets = _zenya_service(), []
+
+    with mock.patch.object(requests.Session, "send", _zenya_pages(300, offsets, total=True)):
+        documents = service.collect_documents(max_results=60)
+
+    assert len(documents) >= 60
+    assert sorted(offsets) == [0, 50]
+
+
+def test_compiled_path_only_walks_dicts():
+    get_email = _compile_path(["details", "contact", "email"])
+
+    assert get_email({"details": {"contact": {"email": "a@b.nl"}}}) == "a@b.nl"
+    assert get_email({"details": {}}) is None
+    assert get_email({"details": {"contact": "a@b.nl"}}) is None
+    assert _compile_path(["items", 0])({"items": ["first"]}) is None
+    assert _compile_path(None)({"details": {}}) is None